@@ -0,0 +1,206 @@
+'''
+This file is responsible for the daily, smoothed and growth
+metrics of every county and state at once.
+The metrics are computed as whole-array operations over the
+(places, days) arrays of a TimeSeriesStore and cached per
+version of the data, so plots and rankings only read them.
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+
+# Metrics computed for every place and day
+METRICS = ["new", "avg7", "avg14", "growth", "doubling"]
+
+# Analytics already computed in this process, by data version
+analytics_cache = dict()
+
+
+def daily_new(cumulative):
+    """
+    This function takes a (places, days) array of cumulative
+    counts and returns the new counts of each day.
+    The first day has no previous day and is NaN.
+    """
+    new = np.empty_like(cumulative)
+    new[:, 0] = np.nan
+    np.subtract(cumulative[:, 1:], cumulative[:, :-1], out=new[:, 1:])
+
+    return new
+
+
+def trailing_difference(total, window):
+    """
+    This function takes a (places, days) array of running
+    totals and returns the change over the window days ending
+    on each day. Days without a full window are NaN.
+    """
+    change = np.full(total.shape, np.nan)
+
+    # Data shorter than the window has no full window at all
+    if total.shape[1] >= window:
+        change[:, window - 1] = total[:, window - 1]
+        change[:, window:] = total[:, window:] - total[:, :-window]
+
+    return change
+
+
+def window_sums(values, window):
+    """
+    This function takes a (places, days) array and returns the
+    sum of the window days ending on each day, computed from a
+    cumulative sum. Windows that are not full or that include a
+    missing day are NaN.
+    """
+    sums = trailing_difference(np.cumsum(np.nan_to_num(values), axis=1),
+                               window)
+    gaps = trailing_difference(np.cumsum(np.isnan(values), axis=1), window)
+    sums[gaps > 0] = np.nan
+
+    return sums
+
+
+def rolling_average(values, window):
+    """
+    This function takes a (places, days) array of daily counts
+    and returns the average of the window days ending on each day.
+    """
+    return window_sums(values, window) / window
+
+
+def weekly_growth(new):
+    """
+    This function takes a (places, days) array of daily counts
+    and returns the week-over-week growth of each day: the
+    total of the last 7 days over the 7 days before, minus one.
+    """
+    weekly = window_sums(new, 7)
+    growth = np.full_like(weekly, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        growth[:, 7:] = weekly[:, 7:] / weekly[:, :-7] - 1
+
+    return growth
+
+
+def doubling_time(cumulative, window=7):
+    """
+    This function takes a (places, days) array of cumulative
+    counts and returns the doubling time in days implied by the
+    growth over the last window days. Places that did not grow
+    get infinity and places starting from zero get NaN.
+    """
+    doubling = np.full_like(cumulative, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ratio = cumulative[:, window:] / cumulative[:, :-window]
+        times = window * np.log(2) / np.log(ratio)
+    times[ratio <= 1] = np.inf
+    times[~np.isfinite(ratio)] = np.nan
+    doubling[:, window:] = times
+
+    return doubling
+
+
+def place_metrics(cumulative):
+    """
+    This function takes a (places, days) array of cumulative
+    counts and returns a dictionary of every metric in METRICS.
+    """
+    new = daily_new(cumulative)
+
+    return {"new": new,
+            "avg7": rolling_average(new, 7),
+            "avg14": rolling_average(new, 14),
+            "growth": weekly_growth(new),
+            "doubling": doubling_time(cumulative)}
+
+
+def compute_analytics(store):
+    """
+    This function takes a TimeSeriesStore and returns a
+    dictionary {level: {kind: {metric: array}}} where level is
+    "county" or "state", kind is "Cases" or "Deaths" and each
+    array has one row per county or state and one column per day.
+    """
+    arrays = {"county": {"Cases": store.cases, "Deaths": store.deaths},
+              "state": {"Cases": store.state_cases,
+                        "Deaths": store.state_deaths}}
+
+    analytics = dict()
+    for level, kinds in arrays.items():
+        analytics[level] = dict()
+        for kind, cumulative in kinds.items():
+            analytics[level][kind] = place_metrics(cumulative)
+
+    return analytics
+
+
+def get_analytics(store, use_cache=True):
+    """
+    This function takes a TimeSeriesStore and returns its
+    analytics (see compute_analytics). Results are cached in
+    memory and on disk for each version of the store's data.
+    """
+    version = store.version()
+    if version in analytics_cache:
+        return analytics_cache[version]
+
+    file_name = data_cache.cache_path("analytics", extension=".npz")
+    analytics = None
+    if use_cache and data_cache.is_current("analytics", version,
+                                           extension=".npz"):
+        with np.load(file_name) as saved:
+            analytics = dict()
+            for name in saved.files:
+                level, kind, metric = name.split("/")
+                analytics.setdefault(level, dict()).setdefault(
+                    kind, dict())[metric] = saved[name]
+
+    if analytics is None:
+        analytics = compute_analytics(store)
+        if use_cache:
+            os.makedirs(data_cache.CACHE_FOLDER, exist_ok=True)
+            arrays = dict()
+            for level, kinds in analytics.items():
+                for kind, metrics in kinds.items():
+                    for metric, array in metrics.items():
+                        arrays[level + "/" + kind + "/" + metric] = array
+            # Written to a temporary file of its own, so processes
+            # saving at the same time never see half of a file
+            temporary = data_cache.temporary_path()
+            with open(temporary, "wb") as handle:
+                np.savez(handle, **arrays)
+            os.replace(temporary, file_name)
+            data_cache.write_keys(["analytics"], version)
+
+    analytics_cache[version] = analytics
+
+    return analytics
+
+
+def rank_places(store, metric="avg7", kind="Cases", level="county", day=-1,
+                top=10, ascending=False):
+    """
+    This function takes a TimeSeriesStore and returns a dataframe
+    of the top counties or states by a metric on one day
+    (the last day by default, or a position or date).
+    ascending = True ranks the lowest values first.
+    """
+    analytics = get_analytics(store)
+    if not isinstance(day, (int, np.integer)):
+        day = store.dates.get_loc(pd.Timestamp(day))
+    values = analytics[level][kind][metric][:, day]
+
+    if level == "county":
+        places = store.metadata[["Province_State", "Admin2"]].copy()
+    else:
+        places = pd.DataFrame({"Province_State": store.states})
+    places[metric] = values
+
+    places = places.dropna(subset=[metric])
+    places = places.sort_values(metric, ascending=ascending)
+
+    return places.head(top).reset_index(drop=True)
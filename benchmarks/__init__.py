@@ -0,0 +1,5 @@
+'''
+Benchmarks for the data analysis pipeline.
+Run them from the project folder, for example
+python -m benchmarks.loaders
+'''
@@ -0,0 +1,131 @@
+'''
+Measures the cold-start import time of every entry point with
+python -X importtime, and which heavy libraries each one loads.
+Every import runs in a fresh interpreter.
+Run from the project folder with
+python -m benchmarks.import_time
+Save the results with --save times.json and check a later run
+against them with --compare times.json, which exits with an
+error when an entry point got slower than the tolerance.
+'''
+
+import argparse
+import json
+import subprocess
+import sys
+
+# Modules run or imported directly by users
+ENTRY_POINTS = ["data_visualization", "jobs", "timeseries", "statistics",
+                "data_imports", "timeseries_batch", "analytics", "spatial",
+                "county_lookup"]
+
+# Libraries that should only load when a code path needs them
+HEAVY_MODULES = ["geopandas", "matplotlib", "scipy", "shapely"]
+
+
+def import_time(module):
+    """
+    This function takes a module name, imports it in a new
+    interpreter and returns its cumulative import time in
+    seconds and the set of every module loaded on the way.
+    The time is None if the import failed.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             "import " + module],
+                            capture_output=True, text=True)
+
+    total = None
+    loaded = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_time, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        loaded.add(name)
+        if name == module:
+            total = int(cumulative) / 10**6
+
+    if result.returncode != 0:
+        total = None
+
+    return total, loaded
+
+
+def import_times(modules=ENTRY_POINTS, repeat=5):
+    """
+    This function takes a list of module names and returns a
+    dictionary from module to the best import time in seconds
+    over repeat runs and the heavy libraries it loads.
+    Modules that fail to import get None seconds.
+    Prints a table of the results.
+    """
+    results = dict()
+    for module in modules:
+        times = list()
+        for attempt in range(repeat):
+            seconds, loaded = import_time(module)
+            times.append(seconds)
+        heavy = [name for name in HEAVY_MODULES if name in loaded]
+        best = None if None in times else min(times)
+        results[module] = {"seconds": best, "heavy": heavy}
+
+    print("{:<20} {:>9}  {}".format("Entry point", "Seconds",
+                                    "Heavy libraries loaded"))
+    for module, row in results.items():
+        if row["seconds"] is None:
+            seconds = "failed"
+        else:
+            seconds = "{:.3f}".format(row["seconds"])
+        print("{:<20} {:>9}  {}".format(module, seconds,
+                                        ", ".join(row["heavy"]) or "-"))
+
+    return results
+
+
+def compare(results, baseline, tolerance=1.25):
+    """
+    This function takes the current and saved results and
+    returns the list of entry points whose import time grew
+    by more than the tolerance factor or that no longer import,
+    printing each of them.
+    """
+    slower = list()
+    for module, row in results.items():
+        if module not in baseline or baseline[module]["seconds"] is None:
+            continue
+        before = baseline[module]["seconds"]
+        if row["seconds"] is None:
+            slower.append(module)
+            print(module + " no longer imports")
+        elif row["seconds"] > before * tolerance:
+            slower.append(module)
+            print(module + " got slower: " + str(round(before, 3)) +
+                  " s -> " + str(round(row["seconds"], 3)) + " s")
+
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("modules", nargs="*", default=ENTRY_POINTS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="JSON file to save the results to")
+    parser.add_argument("--compare", help="JSON file of earlier results")
+    parser.add_argument("--tolerance", type=float, default=1.25)
+    arguments = parser.parse_args()
+
+    results = import_times(arguments.modules, arguments.repeat)
+
+    if arguments.save:
+        with open(arguments.save, "w") as handle:
+            json.dump(results, handle, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as handle:
+            baseline = json.load(handle)
+        if compare(results, baseline, arguments.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+'''
+Compares the memory and time of the original CSV loaders
+(census_organized, get_cases) against the typed, column-pruned
+loaders (load_census, load_cases) on the Project datasets files.
+Run from the project folder with
+python -m benchmarks.loaders
+'''
+
+import time
+
+from data_imports import census_organized
+from data_imports import get_cases
+from data_imports import load_census
+from data_imports import load_cases
+
+
+def measure(function, *args, **kwargs):
+    """
+    This function takes a loader and its arguments and
+    returns the loaded dataframe's memory in MB and the
+    best time in seconds over three runs.
+    """
+    times = list()
+    for attempt in range(3):
+        start = time.perf_counter()
+        data = function(*args, **kwargs)
+        times.append(time.perf_counter() - start)
+
+    memory = data.memory_usage(deep=True).sum() / 2**20
+
+    return memory, min(times)
+
+
+def compare_loaders(engines=(None, "pyarrow")):
+    """
+    This function times every loader on the census, cases
+    and deaths files and prints a table comparing them.
+    Returns the rows of the table as a list of dictionaries.
+    """
+    censusfile = 'Project datasets/CensusData.csv'
+    cases = [("Census", "census_organized", census_organized, (censusfile,),
+              {}),
+             ("Cases", "get_cases", get_cases, ("Cases",), {}),
+             ("Deaths", "get_cases", get_cases, ("Deaths",), {})]
+    for engine in engines:
+        name = "typed" if engine is None else "typed, " + engine
+        cases.append(("Census", "load_census (" + name + ")", load_census,
+                      (censusfile,), {"engine": engine}))
+        cases.append(("Cases", "load_cases (" + name + ")", load_cases,
+                      ("Cases",), {"engine": engine}))
+        cases.append(("Deaths", "load_cases (" + name + ")", load_cases,
+                      ("Deaths",), {"engine": engine}))
+
+    rows = list()
+    for source, loader, function, args, kwargs in cases:
+        try:
+            memory, seconds = measure(function, *args, **kwargs)
+        except ImportError as error:
+            print(loader + " skipped: " + str(error))
+            continue
+        rows.append({"source": source, "loader": loader,
+                     "memory_mb": memory, "seconds": seconds})
+
+    rows.sort(key=lambda row: row["source"])
+    print("{:<8} {:<32} {:>10} {:>9}".format("Source", "Loader",
+                                             "Memory MB", "Seconds"))
+    for row in rows:
+        print("{:<8} {:<32} {:>10.2f} {:>9.3f}".format(
+            row["source"], row["loader"], row["memory_mb"], row["seconds"]))
+
+    return rows
+
+
+if __name__ == "__main__":
+    compare_loaders()
@@ -0,0 +1,74 @@
+'''
+Measures the vertex count and the choropleth render time of the
+county and state geometry at every level of detail, against the
+full resolution geometry from the shapefile.
+Run from the project folder with
+python -m benchmarks.lod
+'''
+
+import io
+import time
+
+import shapely
+
+from choropleth import Choropleth
+from data_imports import geometry_levels
+from data_imports import get_merged
+from data_imports import state_geometries
+
+
+def render_time(geometry, values, repeats=3):
+    """
+    This function takes a GeoSeries and the values to color
+    it by and returns the best time in seconds to build a
+    choropleth of it and render it to a PNG in memory.
+    """
+    times = list()
+    for attempt in range(repeats):
+        start = time.perf_counter()
+        choropleth = Choropleth(geometry)
+        choropleth.draw(values, "", io.BytesIO())
+        choropleth.close()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def benchmark_levels():
+    """
+    This function prints the vertex count and render time of
+    the county and state geometry at every level of detail.
+    Returns the rows of the table as a list of dictionaries.
+    """
+    merged_data = get_merged()[0]
+    states = state_geometries(merged_data).reset_index()
+
+    geometry_sets = [("county", merged_data, 'FIPS'),
+                     ("state", states, 'STATEFP')]
+
+    rows = list()
+    for name, data, key in geometry_sets:
+        levels = {"full": data.set_index(key).geometry}
+        levels.update(geometry_levels(data, key, name))
+
+        for level, geometry in levels.items():
+            # The levels drop rows without geometry or with a repeated
+            # key, so the values are taken from the rows of the level
+            values = geometry.index.to_numpy(dtype=float)
+            vertices = int(shapely.get_num_coordinates(
+                geometry.values).sum())
+            seconds = render_time(geometry, values)
+            rows.append({"geometry": name, "level": level,
+                         "vertices": vertices, "seconds": seconds})
+
+    print("{:<9} {:<9} {:>10} {:>9}".format("Geometry", "Level",
+                                            "Vertices", "Seconds"))
+    for row in rows:
+        print("{:<9} {:<9} {:>10} {:>9.3f}".format(
+            row["geometry"], row["level"], row["vertices"], row["seconds"]))
+
+    return rows
+
+
+if __name__ == "__main__":
+    benchmark_levels()
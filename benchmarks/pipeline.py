@@ -0,0 +1,205 @@
+'''
+Times every stage of the pipeline on a synthetic dataset made
+by benchmarks.synthetic and measures the peak memory each
+stage allocates. Results are written as JSON so runs on
+different commits or scales can be compared.
+Every stage starts from an empty cache, so it measures a cold run.
+Run from the project folder with
+python -m benchmarks.pipeline --counties 3000 --days 300 --output run.json
+and compare a later run with --compare run.json
+'''
+
+import argparse
+import json
+import os
+import platform
+import time
+import tracemalloc
+
+# Plots are only saved to files, so matplotlib never opens a window
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+
+def measure(function, trace=False):
+    """
+    This function runs function once and returns its result,
+    the wall and CPU seconds it took and the peak memory in MB
+    allocated while it ran (None if trace is False).
+    Tracing memory makes the function several times slower,
+    so times are taken from runs without tracing.
+    """
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    result = function()
+    seconds = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+
+    return result, seconds, cpu, peak
+
+
+def pipeline_stages():
+    """
+    This function returns a list of (name, function) stages.
+    Each function takes the dictionary of earlier results and
+    returns its own result, which is stored under its name.
+    """
+    import data_imports
+    from data_visualization import population_graphs
+    from statistics import get_statistics
+    from timeseries import county_timeseries
+    from timeseries import get_state_data
+    from timeseries import state_timeseries
+    from timeseries_store import TimeSeriesStore
+
+    geofile = "Project datasets/tl_2019_us_county"
+    censusfile = "Project datasets/CensusData.csv"
+
+    def first_county(results):
+        row = results["load_cases"].iloc[0]
+        return row["Admin2"], row["Province_State"]
+
+    return [
+        ("geo_organized", lambda results:
+            data_imports.geo_organized(geofile)),
+        ("load_census", lambda results:
+            data_imports.load_census(censusfile)),
+        ("load_cases", lambda results: data_imports.load_cases("Cases")),
+        ("load_deaths", lambda results: data_imports.load_cases("Deaths")),
+        ("data_merge", lambda results: data_imports.data_merge(
+            results["geo_organized"], results["load_census"],
+            results["load_cases"], results["load_deaths"])),
+        ("get_merged", lambda results:
+            data_imports.get_merged(use_cache=False)[0]),
+        ("get_merged_concurrent", lambda results: data_imports.get_merged(
+            use_cache=False, concurrent=True)[0]),
+        ("TimeSeriesStore", lambda results: TimeSeriesStore.from_frames(
+            results["load_cases"], results["load_deaths"])),
+        ("get_state_data", lambda results: get_state_data(
+            results["load_cases"], first_county(results)[1])),
+        ("county_timeseries", lambda results: county_timeseries(
+            results["TimeSeriesStore"], "Cases", *first_county(results))),
+        ("state_timeseries", lambda results: state_timeseries(
+            results["TimeSeriesStore"], "Cases", first_county(results)[1])),
+        ("population_graphs", lambda results: population_graphs(
+            results["data_merge"], "US", "Normalized", "Density",
+            use_cache=False)),
+        ("get_statistics", lambda results: get_statistics(
+            results["data_merge"], para="Density"))]
+
+
+def run_pipeline(folder, repeat=1, trace=True):
+    """
+    This function takes a folder holding a 'Project datasets'
+    folder and times every pipeline stage in it, repeat times.
+    Returns a dictionary from stage name to its best wall and
+    CPU seconds, peak memory in MB and result rows, and a
+    dictionary with the number of counties and days read.
+    """
+    from timeseries_store import date_columns
+
+    import data_cache
+
+    stages = dict()
+    previous = os.getcwd()
+    os.chdir(folder)
+    try:
+        results = dict()
+        for name, stage in pipeline_stages():
+            best = None
+            for attempt in range(repeat):
+                data_cache.invalidate()
+                result, seconds, cpu, peak = measure(lambda: stage(results))
+                if best is None or seconds < best["seconds"]:
+                    best = {"seconds": seconds, "cpu_seconds": cpu}
+
+            # Memory is measured in one more run of its own
+            best["peak_mb"] = None
+            if trace:
+                data_cache.invalidate()
+                best["peak_mb"] = measure(lambda: stage(results), True)[3]
+
+            results[name] = result
+            best["rows"] = len(result) if hasattr(result, "__len__") \
+                else None
+            stages[name] = best
+            print("{:<20} {:>9.3f} s {:>9} MB".format(
+                name, best["seconds"], "-" if best["peak_mb"] is None
+                else "{:.1f}".format(best["peak_mb"])))
+    finally:
+        os.chdir(previous)
+
+    # Read from the data, since an existing folder may have any size
+    cases = results["load_cases"]
+    size = {"counties": len(cases), "days": len(date_columns(cases))}
+
+    return stages, size
+
+
+def compare(stages, baseline):
+    """
+    This function takes the stages of this run and of a saved
+    run and prints the ratio of their times and peak memory.
+    """
+    print("{:<20} {:>10} {:>10} {:>8} {:>8}".format(
+        "Stage", "Before s", "After s", "Time x", "Memory x"))
+    for name, stage in stages.items():
+        if name not in baseline:
+            continue
+        before = baseline[name]
+        memory = "-"
+        if stage["peak_mb"] and before["peak_mb"]:
+            memory = "{:.2f}".format(stage["peak_mb"] / before["peak_mb"])
+        print("{:<20} {:>10.3f} {:>10.3f} {:>8.2f} {:>8}".format(
+            name, before["seconds"], stage["seconds"],
+            stage["seconds"] / before["seconds"], memory))
+
+
+def main():
+    from benchmarks.synthetic import generate
+
+    parser = argparse.ArgumentParser(description="Times the pipeline "
+                                     "stages on synthetic data")
+    parser.add_argument("--counties", type=int, default=3000)
+    parser.add_argument("--days", type=int, default=300)
+    parser.add_argument("--folder", default=None,
+                        help="folder of an existing synthetic dataset")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--no-trace", action="store_true",
+                        help="skip the extra run of each stage that "
+                        "measures memory")
+    parser.add_argument("--output", help="JSON file to write results to")
+    parser.add_argument("--compare", help="JSON file of an earlier run")
+    arguments = parser.parse_args()
+
+    folder = arguments.folder
+    if folder is None:
+        folder = ("bench_" + str(arguments.counties) + "x" +
+                  str(arguments.days))
+        if not os.path.exists(os.path.join(folder, "Project datasets",
+                                           "Cases.csv")):
+            print("Generating " + folder)
+            generate(arguments.counties, arguments.days, folder)
+
+    stages, size = run_pipeline(folder, arguments.repeat,
+                                not arguments.no_trace)
+
+    run = {"counties": size["counties"], "days": size["days"],
+           "folder": folder, "python": platform.python_version(),
+           "machine": platform.machine(), "stages": stages}
+    if arguments.output:
+        with open(arguments.output, "w") as handle:
+            json.dump(run, handle, indent=2)
+
+    if arguments.compare:
+        with open(arguments.compare) as handle:
+            compare(stages, json.load(handle)["stages"])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+'''
+Generates a synthetic copy of the Project datasets folder at
+any scale: a county shapefile, CensusData.csv, Cases.csv and
+Deaths.csv with the same columns as the real files.
+The counties are a grid of polygons over the continental US
+whose shared edges are jagged, so they tile without gaps like
+real county boundaries and simplification has work to do.
+Run from the project folder with
+python -m benchmarks.synthetic --counties 3000 --days 300 --folder bench
+'''
+
+import argparse
+import datetime
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+# Bounds of the grid in degrees (west, south, east, north)
+BOUNDS = (-125.0, 24.0, -66.0, 50.0)
+
+# State codes used for the synthetic states, skipping the codes
+# data_imports drops as outside the continental US
+EXCLUDED_STATES = {2, 3, 7, 14, 15, 43, 52, 60, 64, 66, 67, 68, 69, 70, 71,
+                   72, 74, 76, 78, 79, 81, 86, 89, 95}
+
+# Largest number of counties per state, so FIPS codes stay unique
+COUNTIES_PER_STATE = 999
+
+
+def grid_shape(counties):
+    """
+    This function returns the (columns, rows) of a grid with at
+    least the given number of cells and about the shape of BOUNDS.
+    """
+    west, south, east, north = BOUNDS
+    aspect = (east - west) / (north - south)
+    columns = int(np.ceil(np.sqrt(counties * aspect)))
+    rows = int(np.ceil(counties / columns))
+
+    return columns, rows
+
+
+def jagged_grid(counties, points=8, seed=0):
+    """
+    This function returns an array of shapely polygons, one per
+    county, tiling BOUNDS in a grid. Every edge has points
+    inner vertices moved across the edge by a random amount,
+    and neighbouring polygons share exactly the same edge.
+    """
+    import shapely
+
+    rng = np.random.default_rng(seed)
+    columns, rows = grid_shape(counties)
+    west, south, east, north = BOUNDS
+    width = (east - west) / columns
+    height = (north - south) / rows
+
+    # Offsets fade out towards the corners so edges never cross
+    t = np.arange(1, points + 1) / (points + 1)
+    taper = 0.1 * np.sin(np.pi * t)
+    across_x = rng.uniform(-1, 1, (columns, rows + 1, points)) * taper
+    across_y = rng.uniform(-1, 1, (columns + 1, rows, points)) * taper
+
+    i, j = np.divmod(np.arange(counties), rows)
+    i = i[:, None]
+    j = j[:, None]
+
+    def horizontal(i, j):
+        # Points along the edge from (i, j) to (i + 1, j)
+        x = west + (i + t) * width
+        y = south + (j + across_x[i[:, 0], j[:, 0]]) * height
+        return np.stack([x, y], axis=-1)
+
+    def vertical(i, j):
+        # Points along the edge from (i, j) to (i, j + 1)
+        x = west + (i + across_y[i[:, 0], j[:, 0]]) * width
+        y = south + (j + t) * height
+        return np.stack([x, y], axis=-1)
+
+    def corner(i, j):
+        return np.stack([west + i * width, south + j * height], axis=-1)
+
+    rings = np.concatenate([
+        corner(i, j), horizontal(i, j),
+        corner(i + 1, j), vertical(i + 1, j),
+        corner(i + 1, j + 1), horizontal(i, j + 1)[:, ::-1],
+        corner(i, j + 1), vertical(i, j)[:, ::-1],
+        corner(i, j)], axis=1)
+
+    return shapely.polygons(rings)
+
+
+def county_table(counties, seed=0):
+    """
+    This function returns a dataframe with the state code,
+    county code, names and population of every county.
+    """
+    rng = np.random.default_rng(seed)
+    codes = (code for code in itertools.count(1)
+             if code not in EXCLUDED_STATES)
+    states = list(itertools.islice(
+        codes, int(np.ceil(counties / COUNTIES_PER_STATE))))
+    per_state = int(np.ceil(counties / len(states)))
+
+    position = np.arange(counties)
+    state = np.asarray(states)[position // per_state]
+    county = position % per_state + 1
+    names = pd.Series(position).map(lambda number: "County " + str(number))
+
+    return pd.DataFrame({"STATE": state, "COUNTY": county,
+                         "FIPS": state * 1000 + county,
+                         "NAME": names,
+                         "STNAME": ["State " + str(code) for code in state],
+                         "POPESTIMATE2019": rng.lognormal(10, 1.2, counties)
+                         .astype(np.int32) + 100})
+
+
+def write_geo(table, geometry, folder):
+    """
+    This function writes the counties as a shapefile in the
+    layout of tl_2019_us_county.
+    """
+    import geopandas as gpd
+
+    points = gpd.GeoSeries(geometry).representative_point()
+    geo = gpd.GeoDataFrame({
+        "STATEFP": table["STATE"].map("{:02d}".format),
+        "COUNTYFP": table["COUNTY"].map("{:03d}".format),
+        "COUNTYNS": table.index.map("{:08d}".format),
+        "NAME": table["NAME"],
+        "NAMELSAD": table["NAME"] + " County",
+        "INTPTLAT": points.y.map("{:+.7f}".format),
+        "INTPTLON": points.x.map("{:+.7f}".format)},
+        geometry=geometry, crs="EPSG:4269")
+
+    shapefile = folder + "tl_2019_us_county/"
+    os.makedirs(shapefile, exist_ok=True)
+    geo.to_file(shapefile + "tl_2019_us_county.shp")
+
+
+def write_census(table, folder, seed=0):
+    """
+    This function writes CensusData.csv with a total row for
+    every state followed by one row per county.
+    """
+    rng = np.random.default_rng(seed)
+    states = table.groupby("STATE", as_index=False).agg(
+        STNAME=("STNAME", "first"), POPESTIMATE2019=("POPESTIMATE2019", "sum"))
+    states["COUNTY"] = 0
+    states["CTYNAME"] = states["STNAME"]
+
+    counties = table[["STATE", "COUNTY", "STNAME", "POPESTIMATE2019"]].copy()
+    counties["CTYNAME"] = table["NAME"] + " County"
+
+    census = pd.concat([states, counties], ignore_index=True)
+    census.insert(0, "SUMLEV", np.where(census["COUNTY"] == 0, 40, 50))
+    for column in ["NPOPCHG_2019", "BIRTHS2019", "DEATHS2019",
+                   "NATURALINC2019", "INTERNATIONALMIG2019",
+                   "DOMESTICMIG2019", "NETMIG2019"]:
+        census[column] = rng.integers(-500, 500, len(census))
+
+    census.to_csv(folder + "CensusData.csv", index=False)
+
+
+def write_timeseries(table, days, folder, seed=0, chunk=5000):
+    """
+    This function writes Cases.csv and Deaths.csv in the wide
+    JHU layout with one column per day, a few thousand counties
+    at a time so memory stays bounded at any scale.
+    """
+    rng = np.random.default_rng(seed)
+    start = datetime.date(2020, 1, 22)
+    dates = [start + datetime.timedelta(days=day) for day in range(days)]
+    columns = [str(date.month) + "/" + str(date.day) + "/" +
+               str(date.year % 100) for date in dates]
+
+    for kind in ["Cases", "Deaths"]:
+        if os.path.exists(folder + kind + ".csv"):
+            os.remove(folder + kind + ".csv")
+
+    for first in range(0, len(table), chunk):
+        part = table.iloc[first:first + chunk]
+        rate = part["POPESTIMATE2019"].to_numpy()[:, None] / 10**5
+        growth = np.linspace(0.2, 3, days)[None, :]
+        daily = rng.poisson(rate * growth, (len(part), days))
+        cases = daily.cumsum(axis=1)
+        deaths = rng.binomial(daily, 0.02).cumsum(axis=1)
+
+        meta = pd.DataFrame({
+            "UID": 84000000 + part["FIPS"].to_numpy(), "iso2": "US",
+            "iso3": "USA", "code3": 840,
+            "FIPS": part["FIPS"].astype(float).to_numpy(),
+            "Admin2": part["NAME"].to_numpy(),
+            "Province_State": part["STNAME"].to_numpy(),
+            "Country_Region": "US", "Lat": 0.0, "Long_": 0.0})
+        meta["Combined_Key"] = (meta["Admin2"] + ", " +
+                                meta["Province_State"] + ", US")
+        meta["Population"] = part["POPESTIMATE2019"].to_numpy()
+
+        for kind, values in [("Cases", cases), ("Deaths", deaths)]:
+            frame = pd.concat([meta, pd.DataFrame(values, columns=columns)],
+                              axis=1)
+            frame.to_csv(folder + kind + ".csv", index=False,
+                         mode="a", header=first == 0)
+
+
+def generate(counties, days, folder, seed=0):
+    """
+    This function writes a synthetic 'Project datasets' folder
+    with the given number of counties and days inside folder,
+    along with the output folders the pipeline saves plots to.
+    Returns the path of the 'Project datasets' folder.
+    """
+    datasets = os.path.join(folder, "Project datasets") + "/"
+    for output in ["Geo_graphs", "Timeseries", "Statistics"]:
+        os.makedirs(datasets + output, exist_ok=True)
+
+    table = county_table(counties, seed)
+    write_geo(table, jagged_grid(counties, seed=seed), datasets)
+    write_census(table, datasets, seed)
+    write_timeseries(table, days, datasets, seed)
+
+    return datasets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Writes a synthetic "
+                                     "Project datasets folder")
+    parser.add_argument("--counties", type=int, default=3000)
+    parser.add_argument("--days", type=int, default=300)
+    parser.add_argument("--folder", default="bench")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+
+    datasets = generate(arguments.counties, arguments.days, arguments.folder,
+                        arguments.seed)
+    print("Wrote " + str(arguments.counties) + " counties and " +
+          str(arguments.days) + " days to " + datasets)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+'''
+This file is responsible for drawing choropleth maps.
+The polygons of a geometry set are converted to matplotlib
+paths once, and every map of that set only changes the
+colors, color limits, legend and title.
+'''
+
+import numpy as np
+import shapely
+from matplotlib.collections import PatchCollection
+from matplotlib.figure import Figure
+from matplotlib.patches import PathPatch
+from matplotlib.path import Path
+
+
+def geometry_paths(geometry):
+    """
+    This function takes a GeoSeries of polygons and
+    multipolygons and returns a list with one matplotlib
+    path per geometry, holes included.
+    Empty or missing geometries get an empty path.
+    """
+    geoms = np.asarray(geometry.values, dtype=object)
+
+    # Splits every geometry into polygons, rings and points at once
+    parts, part_geom = shapely.get_parts(geoms, return_index=True)
+    rings, ring_part = shapely.get_rings(parts, return_index=True)
+    coords, coord_ring = shapely.get_coordinates(rings, return_index=True)
+    if len(coords) == 0:
+        return [Path(np.empty((0, 2))) for geom in geoms]
+
+    # Each ring starts with a move and ends by closing the polygon
+    codes = np.full(len(coords), Path.LINETO, dtype=Path.code_type)
+    starts = np.r_[True, coord_ring[1:] != coord_ring[:-1]]
+    ends = np.r_[coord_ring[1:] != coord_ring[:-1], True]
+    codes[starts] = Path.MOVETO
+    codes[ends] = Path.CLOSEPOLY
+
+    # Splits the points back into one block per geometry
+    coord_geom = part_geom[ring_part[coord_ring]]
+    counts = np.bincount(coord_geom, minlength=len(geoms))
+    bounds = np.cumsum(counts)[:-1]
+    vertices = np.split(coords, bounds)
+    path_codes = np.split(codes, bounds)
+
+    return [Path(vertex, code) for vertex, code in zip(vertices, path_codes)]
+
+
+class Choropleth:
+    """
+    This class holds one figure with the polygons of a
+    geometry set and a colorbar, so several maps of the
+    same places can be saved without rebuilding the polygons.
+    """
+
+    def __init__(self, geometry):
+        self.figure = Figure()
+        self.axes = self.figure.subplots()
+
+        patches = [PathPatch(path) for path in geometry_paths(geometry)]
+        self.collection = PatchCollection(patches, cmap="viridis")
+        self.collection.set_array(np.zeros(len(patches)))
+        self.axes.add_collection(self.collection)
+        self.colorbar = self.figure.colorbar(self.collection, ax=self.axes)
+
+        # Same framing as GeoDataFrame.plot
+        self.axes.autoscale_view()
+        minx, miny, maxx, maxy = geometry.total_bounds
+        middle = np.deg2rad((miny + maxy) / 2)
+        # An empty geometry set has no bounds to take the aspect from
+        if geometry.crs is not None and geometry.crs.is_geographic and \
+                np.isfinite(middle):
+            self.axes.set_aspect(1 / np.cos(middle))
+        else:
+            self.axes.set_aspect("equal")
+        self.axes.set_xticks([])
+        self.axes.set_yticks([])
+
+    def draw(self, values, title, file_name, clim=None):
+        """
+        This function takes the values to color each
+        geometry by, a title and a file name (or a file object
+        such as io.BytesIO) and saves the map as a PNG.
+        clim is an optional (min, max) tuple of color limits.
+        Missing values are left blank.
+        """
+        values = np.ma.masked_invalid(np.asarray(values, dtype=np.float64))
+        self.collection.set_array(values)
+
+        if clim is None and values.count() > 0:
+            clim = (values.min(), values.max())
+        if clim is not None:
+            self.collection.set_clim(*clim)
+        self.colorbar.update_normal(self.collection)
+
+        self.axes.set_title(title)
+        self.figure.savefig(file_name, format="png")
+
+    def close(self):
+        """
+        This function releases the figure and its polygons.
+        """
+        self.figure.clear()
+        self.collection = None
+        self.colorbar = None
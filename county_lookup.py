@@ -0,0 +1,125 @@
+'''
+This file is responsible for finding the county of
+latitude/longitude points, such as facility or event
+locations, so they can be joined with the merged dataset.
+The county polygons are put into an STRtree spatial index
+once and points are looked up in chunks with one bulk
+query per chunk, so memory stays bounded for any number
+of points.
+'''
+
+import numpy as np
+import pandas as pd
+import shapely
+
+# Number of points looked up together
+CHUNK_SIZE = 1000000
+
+
+class CountyLocator:
+    """
+    This class holds the county polygons in a spatial index
+    and returns the FIPS code, NAME and STNAME of the county
+    containing each point.
+    counties is a geodataframe with a geometry and a NAME column
+    and either FIPS or STATEFP/COUNTYFP, such as the output of
+    data_imports.get_merged or data_imports.geo_organized.
+    state_names optionally maps STATEFP to the state name when
+    counties has no STNAME column.
+    """
+
+    def __init__(self, counties, state_names=None):
+        from data_imports import county_fips
+
+        counties = counties[counties['geometry'].notna()]
+        if "FIPS" in counties.columns:
+            fips = counties["FIPS"]
+        else:
+            fips = county_fips(counties, "Geo")
+
+        if "STNAME" in counties.columns:
+            stname = counties["STNAME"]
+        elif state_names is not None:
+            stname = counties["STATEFP"].astype(int).map(state_names)
+        else:
+            stname = pd.Series(np.nan, index=counties.index)
+
+        self.fips = pd.array(fips.to_numpy(), dtype="Int64")
+        self.names = counties["NAME"].astype(object).to_numpy()
+        self.stnames = stname.astype(object).to_numpy()
+        self.geometry = np.asarray(counties['geometry'].values, dtype=object)
+        self.tree = shapely.STRtree(self.geometry)
+
+    @classmethod
+    def from_files(cls, geofile="Project datasets/tl_2019_us_county",
+                   censusfile="Project datasets/CensusData.csv"):
+        """
+        This function builds a CountyLocator from the county
+        shapefile, taking the state names from the census file.
+        """
+        from data_imports import census_organized
+        from data_imports import geo_organized
+
+        census = census_organized(censusfile)
+        states = census[census["COUNTY"] == 0]
+        state_names = dict(zip(states["STATE"], states["STNAME"]))
+
+        return cls(geo_organized(geofile), state_names)
+
+    def positions(self, lat, lon, chunk_size=CHUNK_SIZE):
+        """
+        This function takes arrays of latitudes and longitudes
+        in degrees and returns the position of the county holding
+        each point, or -1 for points outside every county.
+        Points on a shared border go to the first of the counties.
+        """
+        lat = pd.to_numeric(np.asarray(lat).ravel(), errors='coerce')
+        lon = pd.to_numeric(np.asarray(lon).ravel(), errors='coerce')
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+
+        found = np.full(len(lat), -1, dtype=np.int64)
+        for start in range(0, len(lat), chunk_size):
+            stop = start + chunk_size
+            points = shapely.points(lon[start:stop], lat[start:stop])
+            point, county = self.tree.query(points, predicate="intersects")
+
+            # Keeps the first county of each point
+            order = np.lexsort((county, point))
+            point = point[order]
+            county = county[order]
+            first = np.r_[True, point[1:] != point[:-1]]
+            found[start + point[first]] = county[first]
+
+        return found
+
+    def locate(self, lat, lon, chunk_size=CHUNK_SIZE):
+        """
+        This function takes arrays of latitudes and longitudes
+        in degrees and returns a dataframe with the FIPS, NAME and
+        STNAME of the county holding each point, in the same order.
+        Points outside every county get missing values.
+        """
+        found = self.positions(lat, lon, chunk_size)
+        matched = found >= 0
+        index = np.where(matched, found, 0)
+
+        fips = self.fips[index]
+        fips[~matched] = pd.NA
+        names = np.where(matched, self.names[index], None)
+        stnames = np.where(matched, self.stnames[index], None)
+
+        return pd.DataFrame({"FIPS": fips, "NAME": names, "STNAME": stnames})
+
+    def locate_frame(self, data, lat="INTPTLAT", lon="INTPTLON",
+                     chunk_size=CHUNK_SIZE):
+        """
+        This function takes a dataframe with latitude and
+        longitude columns (INTPTLAT/INTPTLON by default, which
+        may hold strings such as '+47.49') and returns a copy
+        with the FIPS, NAME and STNAME of each row's county added.
+        """
+        located = self.locate(data[lat], data[lon], chunk_size)
+        located.index = data.index
+
+        return data.join(located, rsuffix="_county")
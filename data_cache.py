@@ -0,0 +1,232 @@
+'''
+This file is responsible for caching the merged dataset
+on disk so that later runs can skip re-reading and
+re-merging the source files.
+The cache is stored in 'Project datasets/Cache' and is
+keyed on the size, modification time and content hash
+of every source file. The key of each cached item is kept in
+a file of its own next to it, so processes saving different
+items never overwrite each other's keys.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+
+CACHE_FOLDER = "Project datasets/Cache/"
+
+# Bump this when the layout of the cached frames changes
+CACHE_VERSION = 4
+
+# Hashes of the files already read in this process, by
+# (file name, size, modification time)
+file_hashes = dict()
+
+
+def file_fingerprint(path):
+    """
+    This function takes a path to a file or a folder
+    and returns a dictionary with the size, modification
+    time and sha256 hash of every file it contains.
+    """
+    if os.path.isdir(path):
+        names = sorted(os.listdir(path))
+        files = [os.path.join(path, name) for name in names]
+    else:
+        files = [path]
+
+    fingerprint = dict()
+    for file_name in files:
+        if not os.path.isfile(file_name):
+            continue
+        stat = os.stat(file_name)
+
+        # A file whose size and modification time did not change
+        # since it was last hashed is not read again
+        stat_key = (file_name, stat.st_size, stat.st_mtime_ns)
+        if stat_key not in file_hashes:
+            digest = hashlib.sha256()
+            with open(file_name, "rb") as handle:
+                for block in iter(lambda: handle.read(1 << 20), b""):
+                    digest.update(block)
+            file_hashes[stat_key] = digest.hexdigest()
+
+        fingerprint[file_name] = {"size": stat.st_size,
+                                  "mtime": stat.st_mtime_ns,
+                                  "sha256": file_hashes[stat_key]}
+
+    return fingerprint
+
+
+def source_key(paths):
+    """
+    This function takes a list of source paths and
+    returns a single hash string identifying the exact
+    version of all of them together.
+    """
+    fingerprints = {"version": CACHE_VERSION}
+    for path in paths:
+        fingerprints[path] = file_fingerprint(path)
+
+    text = json.dumps(fingerprints, sort_keys=True)
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def subset_key(key, values):
+    """
+    This function takes the key of the source files and the
+    values identifying the rows a cached item is built from
+    (such as FIPS codes) and returns a key for that item, so
+    it is rebuilt when it is asked for with other rows.
+    """
+    digest = hashlib.sha256(key.encode())
+    digest.update(json.dumps(sorted(str(value) for value in set(values)))
+                  .encode())
+
+    return digest.hexdigest()
+
+
+def cache_path(name, folder=CACHE_FOLDER, extension=".parquet"):
+    """
+    This function takes the name of a cached item and
+    returns the file name it is stored under.
+    """
+    return folder + name + extension
+
+
+def temporary_path(folder=CACHE_FOLDER):
+    """
+    This function returns the name of a new empty file in
+    folder for a cached item to be written to before it is
+    moved in place with os.replace. Each writer gets a file of
+    its own, so several processes can save at once.
+    """
+    descriptor, temporary = tempfile.mkstemp(suffix=".tmp", dir=folder)
+    os.close(descriptor)
+
+    return temporary
+
+
+def read_key(name, folder=CACHE_FOLDER):
+    """
+    This function returns the key the cached item name was
+    saved with, or None if it was never saved.
+    """
+    try:
+        with open(cache_path(name, folder, ".key")) as handle:
+            return handle.read()
+    except FileNotFoundError:
+        return None
+
+
+def write_keys(names, key, folder=CACHE_FOLDER):
+    """
+    This function records that the cached items in the
+    list names were saved with the given key.
+    """
+    for name in names:
+        temporary = temporary_path(folder)
+        with open(temporary, "w") as handle:
+            handle.write(key)
+        os.replace(temporary, cache_path(name, folder, ".key"))
+
+
+def is_current(name, key, folder=CACHE_FOLDER, extension=".parquet"):
+    """
+    This function returns True if the cached item name
+    exists and was saved with the given key.
+    """
+    return read_key(name, folder) == key and \
+        os.path.exists(cache_path(name, folder, extension))
+
+
+def invalidate(folder=CACHE_FOLDER):
+    """
+    This function deletes every cached item so that the
+    next run rebuilds them from the source files.
+    """
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+
+
+def load_frames(names, key, folder=CACHE_FOLDER):
+    """
+    This function takes a list of cached item names and the
+    key of the current source files and returns the cached
+    dataframes as a list, or None if any of them is missing
+    or out of date. Frames with geometry load as GeoDataFrames.
+    """
+    if not all(is_current(name, key, folder) for name in names):
+        return None
+
+    try:
+        import geopandas as gpd
+        import pandas as pd
+
+        frames = list()
+        for name in names:
+            try:
+                frames.append(gpd.read_parquet(cache_path(name, folder)))
+            except ValueError:
+                # Plain dataframes have no geometry metadata
+                frames.append(pd.read_parquet(cache_path(name, folder)))
+    except (ImportError, OSError, ValueError):
+        return None
+
+    return frames
+
+
+def save_frames(frames, key, folder=CACHE_FOLDER):
+    """
+    This function takes a dictionary of item names to
+    dataframes and the key of the current source files
+    and writes them to the cache.
+    Returns True if the cache was written.
+    """
+    os.makedirs(folder, exist_ok=True)
+
+    # Writes to temporary names first so an interrupted
+    # run never leaves a half written cache behind
+    temporaries = dict()
+    try:
+        for name, frame in frames.items():
+            temporaries[name] = temporary_path(folder)
+            frame.to_parquet(temporaries[name])
+    except (ImportError, ValueError) as error:
+        print("Could not write the dataset cache: " + str(error))
+        for temporary in temporaries.values():
+            os.remove(temporary)
+        return False
+
+    for name, temporary in temporaries.items():
+        os.replace(temporary, cache_path(name, folder))
+    write_keys(list(frames), key, folder)
+
+    return True
+
+
+def load_merged(key, folder=CACHE_FOLDER):
+    """
+    This function takes the key of the current source files
+    and returns the cached (merged, cases, deaths) tuple,
+    or None if the cache is missing or out of date.
+    """
+    frames = load_frames(["merged", "cases", "deaths"], key, folder)
+    if frames is None:
+        return None
+
+    return tuple(frames)
+
+
+def save_merged(key, merged, cases, deaths, folder=CACHE_FOLDER):
+    """
+    This function takes the key of the current source files
+    and the merged, cases and deaths frames and writes them
+    to the cache. Returns True if the cache was written.
+    """
+    return save_frames({"merged": merged, "cases": cases,
+                        "deaths": deaths}, key, folder)
@@ -7,31 +7,61 @@ Datasets:
 4) Deaths
 '''
 
-import geopandas as gpd
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_EXCEPTION
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+
+import numpy as np
 import pandas as pd
+
+import data_cache
+from instrument import instrumented
+from metric_cube import MetricCube
+from timeseries_archive import TimeSeriesArchive
+from timeseries_store import TimeSeriesStore
+from timeseries_store import newest_date_column
+from timeseries_store import parse_date
 # from matplotlib import pyplot as plt
 
+# Simplification tolerance in degrees for each level of detail
+DETAIL_TOLERANCES = {"national": 0.05, "state": 0.01, "county": 0.001}
+
+# Source file of each kind of case data
+CASES_FILES = {"Cases": "Project datasets/Cases.csv",
+               "Deaths": "Project datasets/Deaths.csv"}
+
+# State ids of the territories not in the continental US
+EXCLUDED_TERRITORIES = [2, 81, 60, 3, 7, 64, 14, 66, 15, 86, 67, 89, 68, 71,
+                        76, 69, 70, 95, 43, 72, 74, 52, 78, 79]
+
 
+@instrumented
 def geo_organized(file_name):
     '''
     This function organizes an inputed geospacial file.
     Returning a dataset that only contains data for the
     continental United States.
     '''
+    import geopandas as gpd
+
     geodataframe = gpd.read_file(file_name)
     geodataframe['STATEFP'] = geodataframe["STATEFP"].astype(int)
-    # excluded_terr is all ids not in the continental US
-    excluded_terr = [2, 81, 60, 3, 7, 64, 14, 66, 15, 86, 67, 89, 68, 71, 76,
-                     69, 70, 95, 43, 72, 74, 52, 78, 79]
     excluded_columns = ['STATEFP', 'COUNTYFP', 'COUNTYNS', 'NAME', 'NAMELSAD',
                         'INTPTLAT', 'INTPTLON', 'geometry']
 
-    # Remove the ids in excluded_terr from the dataframe
-    geodataframe = geodataframe[~geodataframe.STATEFP.isin(excluded_terr)]
+    # Remove the territories outside the continental US
+    geodataframe = geodataframe[
+        ~geodataframe.STATEFP.isin(EXCLUDED_TERRITORIES)]
 
     # Extracts the wanted columns in excluded_columns from the dataframe
     geodataframe = geodataframe[excluded_columns]
 
+    # Land area in square km, measured once on an equal-area projection
+    geodataframe['area_km2'] = county_area(geodataframe)
+
     # Geospacial data testing
     # print(geodataframe.head())
     # geodataframe.plot()
@@ -40,6 +70,94 @@ def geo_organized(file_name):
     return geodataframe
 
 
+def county_area(geo_data):
+    '''
+    This function takes a geodataframe and returns the
+    area of each geometry in square kilometers.
+    The areas are measured in the Conus Albers equal-area
+    projection (EPSG:5070) so they are comparable across states.
+    '''
+    return geo_data['geometry'].to_crs(epsg=5070).area / 10**6
+
+
+def state_geometries(geo_data, geofile="Project datasets/tl_2019_us_county"):
+    '''
+    This function takes the county geodataframe and returns
+    a geodataframe of state boundaries indexed by STATEFP.
+    Dissolving the counties is slow, so the result is cached
+    and only recomputed when the shapefile or the set of
+    counties changes.
+    '''
+    key = data_cache.subset_key(data_cache.source_key([geofile]),
+                                county_fips(geo_data, "Geo").dropna())
+    cached = data_cache.load_frames(["state_geometries"], key)
+    if cached is not None:
+        return cached[0]
+
+    states = geo_data[['STATEFP', 'geometry']].dissolve(by='STATEFP')
+    data_cache.save_frames({"state_geometries": states}, key)
+
+    return states
+
+
+def simplify_coverage(geometry, tolerance):
+    '''
+    This function takes a GeoSeries of polygons that share
+    edges and a tolerance in the units of its CRS, and returns
+    the simplified GeoSeries. Shared edges are simplified the same
+    way on both sides so no gaps or overlaps open up between
+    neighbours. Shapely versions without coverage_simplify fall
+    back to simplifying each polygon on its own.
+    '''
+    import geopandas as gpd
+    import shapely
+
+    geoms = np.asarray(geometry.values, dtype=object)
+    try:
+        simplified = shapely.coverage_simplify(geoms, tolerance)
+    except (AttributeError, shapely.errors.GEOSException):
+        simplified = shapely.simplify(geoms, tolerance, preserve_topology=True)
+
+    return gpd.GeoSeries(simplified, index=geometry.index, crs=geometry.crs)
+
+
+def geometry_levels(data, key, name,
+                    geofile="Project datasets/tl_2019_us_county"):
+    '''
+    This function takes a geodataframe holding a whole geometry
+    set, the column identifying its rows and a name for the set
+    ("county" or "state"). It returns a dictionary from level of
+    detail (national, state, county) to a GeoSeries of simplified
+    geometry indexed by key.
+    The levels are cached next to the other cached geometry and
+    only rebuilt when the shapefile or the rows of data change.
+    '''
+    import geopandas as gpd
+
+    names = [name + "_lod_" + level for level in DETAIL_TOLERANCES]
+    source_key = data_cache.subset_key(data_cache.source_key([geofile]),
+                                       data[key])
+    cached = data_cache.load_frames(names, source_key)
+
+    if cached is None:
+        base = data[[key, 'geometry']]
+        base = base[base['geometry'].notna() & ~base[key].duplicated()]
+        frames = dict()
+        for level, tolerance in DETAIL_TOLERANCES.items():
+            simplified = simplify_coverage(base['geometry'], tolerance)
+            frames[name + "_lod_" + level] = gpd.GeoDataFrame(
+                {key: base[key]}, geometry=simplified)
+        data_cache.save_frames(frames, source_key)
+        cached = list(frames.values())
+
+    levels = dict()
+    for level, frame in zip(DETAIL_TOLERANCES, cached):
+        levels[level] = frame.set_index(key).geometry
+
+    return levels
+
+
+@instrumented
 def census_organized(file_name):
     '''
     This function reads in the census data and organizes it
@@ -49,7 +167,7 @@ def census_organized(file_name):
     included_columns = ['STNAME', 'CTYNAME', 'POPESTIMATE2019', 'NPOPCHG_2019',
                         'BIRTHS2019', 'DEATHS2019', 'NATURALINC2019',
                         'INTERNATIONALMIG2019', 'DOMESTICMIG2019',
-                        'NETMIG2019', "STATE"]
+                        'NETMIG2019', "STATE", "COUNTY"]
 
     census_data = census_data[included_columns]
 
@@ -58,47 +176,184 @@ def census_organized(file_name):
     return census_data
 
 
-def data_merge(geo_data, census_data, cases_data, deaths_data):
+def county_fips(data, source):
+    '''
+    This function takes a geo, census or cases/deaths dataframe
+    and a string naming its source ("Geo", "Census" or "JHU")
+    and returns a series with the 5-digit integer county FIPS code
+    of every row. Rows without a usable code are NaN.
+    '''
+    if source == "Geo":
+        fips = (data["STATEFP"].astype(int) * 1000 +
+                data["COUNTYFP"].astype(int))
+    elif source == "Census":
+        fips = data["STATE"] * 1000 + data["COUNTY"]
+        # County 0 is the state total row
+        fips = fips.where(data["COUNTY"] != 0)
+    elif source == "JHU":
+        fips = pd.to_numeric(data["FIPS"], errors='coerce')
+
+    return fips.rename("FIPS")
+
+
+def fips_indexed(data, source):
+    '''
+    This function takes a dataframe and its source name
+    and returns it indexed by integer county FIPS code,
+    dropping rows without a code and repeated codes.
+    '''
+    fips = county_fips(data, source)
+    keep = fips.notna() & ~fips.duplicated()
+    indexed = data[keep].set_index(fips[keep].astype(int))
+
+    return indexed.sort_index()
+
+
+def merge_report(geo_data, census_data, cases_data, deaths_data):
+    '''
+    This function takes the four datasets and returns a dataframe
+    listing every row that does not match between the county
+    geometries and the census, cases and deaths data by FIPS code.
+    The Missing column names the dataset the row is missing from.
+    '''
+    sources = {"Geo": (geo_data, "NAME", "STATEFP"),
+               "Census": (census_data, "CTYNAME", "STNAME"),
+               "Cases": (cases_data, "Admin2", "Province_State"),
+               "Deaths": (deaths_data, "Admin2", "Province_State")}
+
+    keys = dict()
+    for name, (data, county, state) in sources.items():
+        source = name if name != "Cases" and name != "Deaths" else "JHU"
+        if name == "Census":
+            data = data[data["COUNTY"] != 0]
+        rows = pd.DataFrame({"FIPS": county_fips(data, source),
+                             "Name": data[county], "State": data[state]})
+        keys[name] = rows
+
+    # Every other dataset is compared against the county geometries
+    reports = list()
+    geo_fips = keys["Geo"]["FIPS"]
+    for name in ["Census", "Cases", "Deaths"]:
+        rows = keys[name]
+        missing = rows[~rows["FIPS"].isin(geo_fips)].copy()
+        missing["Source"] = name
+        missing["Missing"] = "Geo"
+        reports.append(missing)
+
+        missing = keys["Geo"][~geo_fips.isin(rows["FIPS"])].copy()
+        missing["Source"] = "Geo"
+        missing["Missing"] = name
+        reports.append(missing)
+
+    report = pd.concat(reports, ignore_index=True)
+    report["FIPS"] = report["FIPS"].astype("Int64")
+
+    return report[["Source", "Missing", "FIPS", "Name", "State"]]
+
+
+@instrumented
+def data_merge(geo_data, census_data, cases_data, deaths_data=None,
+               key="FIPS"):
     '''
     This function merges all the datasets used in the program
     into one dataset.
+    cases_data can also be a MetricCube holding both the
+    cases and deaths, with deaths_data left as None.
+    If key = "FIPS", the datasets are joined on the integer
+    county FIPS code. If key = "Name", they are joined on
+    the county and state names.
     '''
-    # Most Recent Date needs to be updated if file is updated
-    newest_date = '6/2/2020'
-    death_date = newest_date[0:6]
-    # import the two Corona Virus Datafiles
-    cases_formatted = cases_data.loc[:, ["Province_State", "Admin2",
-                                     newest_date]]
+    if isinstance(cases_data, MetricCube):
+        # The cube already holds the newest day of both
+        cases_formatted = cases_data.newest("Cases")
+        deaths_formatted = cases_data.newest("Deaths")
+    else:
+        # Finds the most recent date column in each file
+        newest_date = newest_date_column(cases_data)
+        death_date = newest_date_column(deaths_data)
+        # import the two Corona Virus Datafiles
+        cases_formatted = cases_data.loc[:, ["FIPS", "Province_State",
+                                             "Admin2", newest_date]]
+
+        deaths_formatted = deaths_data.loc[:, ["FIPS", "Province_State",
+                                               "Admin2", death_date]]
+
+        cases_formatted.rename(columns={newest_date: 'Cases'}, inplace=True)
+        deaths_formatted.rename(columns={death_date: 'Deaths'},
+                                inplace=True)
+
+    if key == "FIPS":
+        merged = fips_merge(geo_data, census_data, cases_formatted,
+                            deaths_formatted)
+    else:
+        merged = name_merge(geo_data, census_data, cases_formatted,
+                            deaths_formatted)
+
+    # Population density in people per square km
+    merged['Density'] = merged['POPESTIMATE2019'] / merged['area_km2']
+
+    # print(merged.loc[(merged["NAME"] == 'Lincoln') &
+    #                  (merged["STATEFP"] == 56)])
+    # merged.plot()
+    # plt.savefig("test.png")
+
+    return merged
+
 
-    deaths_formatted = deaths_data.loc[:, ["Province_State", "Admin2",
-                                           death_date]]
+def name_merge(geo_data, census_data, cases_formatted, deaths_formatted):
+    '''
+    This function joins the geo data, the census data and
+    the newest cases and deaths on the county and state names.
+    '''
     # Merge the Data files
     # Corona Virus files Merged
-    cases_deaths_merged = cases_formatted.merge(deaths_formatted,
+    cases_deaths_merged = cases_formatted.merge(deaths_formatted
+                                                .drop(columns="FIPS"),
                                                 left_on=["Admin2",
                                                          'Province_State'],
                                                 right_on=["Admin2",
                                                           'Province_State'],
                                                 how='left')
 
-    cases_deaths_merged.rename(columns={newest_date: 'Cases',
-                                        death_date: "Deaths"},
-                               inplace=True)
-
     merged = geo_data.merge(census_data, left_on=['NAMELSAD', "STATEFP"],
                             right_on=['CTYNAME', 'STATE'], how='left')
 
     merged = merged.merge(cases_deaths_merged, left_on=["NAME", 'STNAME'],
                           right_on=["Admin2", 'Province_State'], how="left")
 
-    # print(merged.loc[(merged["NAME"] == 'Lincoln') &
-    #                  (merged["STATEFP"] == 56)])
-    # merged.plot()
-    # plt.savefig("test.png")
-
     return merged
 
 
+def fips_merge(geo_data, census_data, cases_formatted, deaths_formatted):
+    '''
+    This function joins the geo data, the census data and
+    the newest cases and deaths on the integer county FIPS
+    code, using index-aligned joins.
+    '''
+    cases_indexed = fips_indexed(cases_formatted, "JHU")
+    deaths_indexed = fips_indexed(deaths_formatted, "JHU")
+
+    # Corona Virus files Merged
+    cases_deaths_merged = cases_indexed[["Province_State", "Admin2",
+                                         "Cases"]]
+    cases_deaths_merged = cases_deaths_merged.join(deaths_indexed["Deaths"],
+                                                   how='left')
+
+    census_indexed = fips_indexed(census_data, "Census")
+    geo_indexed = fips_indexed(geo_data, "Geo")
+
+    merged = geo_indexed.join(census_indexed, how='left')
+    merged = merged.join(cases_deaths_merged, how='left')
+
+    unmatched = merged["STNAME"].isna() | merged["Cases"].isna()
+    if unmatched.any():
+        print(str(unmatched.sum()) + " counties have no census or case data,"
+              " see data_imports.merge_report")
+
+    return merged.reset_index()
+
+
+@instrumented
 def get_cases(kind):
     '''
     This function takes a string with the type of
@@ -107,47 +362,280 @@ def get_cases(kind):
     unneeded rows.
     '''
     # Imports file
-    if kind == "Cases":
-        file_name = "Project datasets/Cases.csv"
-    elif kind == "Deaths":
-        file_name = "Project datasets/Deaths.csv"
+    file_name = CASES_FILES[kind]
 
     data = pd.read_csv(file_name, encoding='cp437')
 
-    # excluded_terr is all ids not in the continental US
-    excluded_terr = [2, 81, 60, 3, 7, 64, 14, 66, 15, 86, 67, 89, 68, 71, 76,
-                     69, 70, 95, 43, 72, 74, 52, 78, 79]
-
-    # Remove the ids in excluded_terr from the dataframe
-    data = data[~data.FIPS.isin(excluded_terr)]
+    # Remove the territories outside the continental US
+    data = data[~data.FIPS.isin(EXCLUDED_TERRITORIES)]
 
     # print(data.head())
 
     return data
 
 
-def get_merged():
+# Columns kept from the census file and their compact types
+CENSUS_DTYPES = {'STNAME': 'category', 'CTYNAME': 'category',
+                 'POPESTIMATE2019': 'int32', 'NPOPCHG_2019': 'int32',
+                 'BIRTHS2019': 'int32', 'DEATHS2019': 'int32',
+                 'NATURALINC2019': 'int32', 'INTERNATIONALMIG2019': 'int32',
+                 'DOMESTICMIG2019': 'int32', 'NETMIG2019': 'int32',
+                 'STATE': 'int32', 'COUNTY': 'int32'}
+
+# Columns kept from the cases and deaths files besides the dates
+CASES_DTYPES = {'UID': 'int64', 'FIPS': 'Int32', 'Admin2': 'category',
+                'Province_State': 'category', 'Population': 'int32'}
+
+
+@instrumented
+def load_census(file_name, engine=None):
+    '''
+    This function reads in the census data like census_organized,
+    but only parses the needed columns and stores them with
+    compact types (int32 counts and categorical names).
+    engine can be "pyarrow" to use the pyarrow CSV reader.
+    '''
+    census_data = pd.read_csv(file_name, encoding='cp437',
+                              usecols=list(CENSUS_DTYPES),
+                              dtype=CENSUS_DTYPES, engine=engine)
+
+    # Keeps the same column order as census_organized
+    return census_data[list(CENSUS_DTYPES)]
+
+
+@instrumented
+def load_cases(kind, engine=None):
+    '''
+    This function imports the Cases or Deaths data like get_cases,
+    but only parses the identifying columns and the date columns,
+    with int32 counts, int32 FIPS codes and categorical names.
+    engine can be "pyarrow" to use the pyarrow CSV reader.
+    '''
+    # Imports file
+    file_name = CASES_FILES[kind]
+
+    # Reads only the header to find the columns to keep
+    header = pd.read_csv(file_name, encoding='cp437', nrows=0).columns
+    columns = [column for column in CASES_DTYPES if column in header]
+    dates = [column for column in header if parse_date(column) is not None]
+
+    # Every column without a type of its own is a date read as int32
+    dtypes = defaultdict(lambda: 'int32', ((column, CASES_DTYPES[column])
+                                           for column in columns))
+    if engine == "pyarrow":
+        # The pyarrow reader ignores the default of a defaultdict
+        dtypes = dict((column, dtypes[column]) for column in columns + dates)
+    data = pd.read_csv(file_name, encoding='cp437', usecols=columns + dates,
+                       dtype=dtypes, engine=engine)
+
+    # Remove the territories outside the continental US
+    data = data[~data.FIPS.isin(EXCLUDED_TERRITORIES)]
+
+    return data
+
+
+def timed(function, argument):
+    '''
+    This function calls function with argument and returns
+    the result and the seconds the call took.
+    '''
+    start = time.perf_counter()
+    result = function(argument)
+
+    return result, time.perf_counter() - start
+
+
+def load_sources(geofile, censusfile, concurrent=True):
+    '''
+    This function reads the geo, census, cases and deaths
+    files and returns a list of the four datasets and a list
+    of the seconds each one took to read.
+    If concurrent = True, the files are read at the same time
+    in a thread pool, since the readers mostly wait on the disk
+    or run in C. The first error of any reader is raised as
+    soon as it happens.
+    '''
+    loaders = [(geo_organized, geofile), (load_census, censusfile),
+               (load_cases, "Cases"), (load_cases, "Deaths")]
+
+    if not concurrent:
+        results = [timed(function, argument) for function, argument
+                   in loaders]
+    else:
+        executor = ThreadPoolExecutor(max_workers=len(loaders))
+        futures = [executor.submit(timed, function, argument)
+                   for function, argument in loaders]
+        done, pending = wait(futures, return_when=FIRST_EXCEPTION)
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        # Raises without waiting for the files still being read
+        for future in futures:
+            if future in done and future.exception() is not None:
+                raise future.exception()
+        results = [future.result() for future in futures]
+
+    datasets = [dataset for dataset, seconds in results]
+    seconds = [seconds for dataset, seconds in results]
+
+    return datasets, seconds
+
+
+@instrumented
+def get_merged(use_cache=True, rebuild=False, concurrent=False):
     '''
     This function imports the census and geospatial
     data, formats them, and then merge them and
     returns the merged dataframe.
+    If use_cache = True, the merged result is read from
+    and written to the on-disk cache in data_cache.
+    If rebuild = True, the cache is ignored and rewritten.
+    If concurrent = True, the four source files are read at
+    the same time and merged as soon as the last one is read.
+    This only helps with several cores or slow disks; on one
+    core it is no faster than reading them one after another.
     '''
-    # Imports geo data
     geofile = "Project datasets/tl_2019_us_county"
-    geodataset = geo_organized(geofile)
-
-    # Imports census data
     censusfile = 'Project datasets/CensusData.csv'
-    censusdataset = census_organized(censusfile)
+    sources = [geofile, censusfile, CASES_FILES["Cases"],
+               CASES_FILES["Deaths"]]
+
+    # Checks the cache before reading any source file
+    if use_cache:
+        key = data_cache.source_key(sources)
+        if not rebuild:
+            cached = data_cache.load_merged(key)
+            if cached is not None:
+                print("Dataset cache hit")
+                return cached
+        print("Dataset cache miss, rebuilding")
+
+    # Imports the geo, census, cases and deaths data
+    start = time.perf_counter()
+    datasets, seconds = load_sources(geofile, censusfile, concurrent)
+    geodataset, censusdataset, casesdataset, deathsdataset = datasets
+
+    # Merges census and geo data
+    merged_data, merge_seconds = timed(lambda data: data_merge(*data),
+                                       datasets)
 
-    # Import Cases data
-    casesdataset = get_cases("Cases")
+    # Read one after another, the slowest file plus the merge is the
+    # critical path, the least time concurrent reading could take.
+    # Read concurrently, the files competed for the CPU, so their
+    # times do not add up to the time of reading them one by one.
+    total = time.perf_counter() - start
+    if concurrent:
+        print("Read the sources concurrently and merged them in " +
+              str(round(total, 2)) + " s")
+    else:
+        print("Read and merged the sources in " + str(round(total, 2)) +
+              " s, critical path " +
+              str(round(max(seconds) + merge_seconds, 2)) + " s")
 
-    # Import Deaths data
-    deathsdataset = get_cases("Deaths")
+    if use_cache:
+        data_cache.save_merged(key, merged_data, casesdataset, deathsdataset)
 
-    # Merges census and geo data
-    merged_data = data_merge(geodataset, censusdataset, casesdataset,
-                             deathsdataset)
+    return merged_data, casesdataset, deathsdataset
 
-    return merged_data, casesdataset, deathsdataset
\ No newline at end of file
+
+def read_new_dates(kind, last_date):
+    '''
+    This function takes the type of cases (Cases or Deaths)
+    and the last date already stored and reads only the
+    date columns after it. Returns a dataframe indexed by
+    (state, county) with one column per new date.
+    '''
+    file_name = CASES_FILES[kind]
+
+    # Reads only the header to find the new date columns
+    header = pd.read_csv(file_name, encoding='cp437', nrows=0).columns
+    new_columns = [column for column in header
+                   if parse_date(column) is not None and
+                   pd.Timestamp(parse_date(column)) > last_date]
+
+    keys = ["Province_State", "Admin2"]
+    dtypes = dict((column, 'float64') for column in new_columns)
+    data = pd.read_csv(file_name, encoding='cp437', usecols=keys + new_columns,
+                       dtype=dtypes)
+
+    data = data.set_index(keys)[new_columns]
+    data = data[~data.index.duplicated()]
+    data.columns = pd.DatetimeIndex([parse_date(column)
+                                     for column in new_columns])
+
+    return data
+
+
+def ingest_new_dates(store, merged_data=None):
+    '''
+    This function takes a TimeSeriesStore and appends every
+    date in Cases.csv and Deaths.csv that is newer than the
+    store, without re-reading the older date columns.
+    If merged_data is given, its Cases and Deaths columns are
+    updated to the newest date.
+    Returns the number of dates added.
+    '''
+    new_cases = read_new_dates("Cases", store.dates[-1])
+    new_deaths = read_new_dates("Deaths", store.dates[-1])
+
+    # Only days present in both files are added
+    dates = new_cases.columns.intersection(new_deaths.columns).sort_values()
+    if len(dates) == 0:
+        print("No new dates to ingest")
+        return 0
+
+    # Lines the new columns up with the store's counties
+    rows = pd.MultiIndex.from_frame(store.metadata[["Province_State",
+                                                    "Admin2"]])
+    cases = new_cases.reindex(index=rows, columns=dates).to_numpy()
+    deaths = new_deaths.reindex(index=rows, columns=dates).to_numpy()
+    store.append(dates, cases, deaths)
+
+    if merged_data is not None:
+        merged_data["Cases"] = merged_data["FIPS"].map(store.latest("Cases"))
+        merged_data["Deaths"] = merged_data["FIPS"].map(
+            store.latest("Deaths"))
+
+    print("Ingested " + str(len(dates)) + " new dates up to " +
+          str(dates[-1].date()))
+
+    return len(dates)
+
+
+def get_incremental(rebuild=False):
+    '''
+    This function returns the merged dataframe and a
+    TimeSeriesStore of the cases and deaths for daily updates.
+    The first run builds both from the source files and saves
+    them to the cache. Later runs only read the date columns
+    newer than the saved store, append them, and update the
+    Cases and Deaths of the merged dataframe.
+    The store is also kept up to date in the memory-mapped
+    archive of timeseries_archive, only writing the new days.
+    If rebuild = True, both are rebuilt from the source files.
+    '''
+    geofile = "Project datasets/tl_2019_us_county"
+    censusfile = 'Project datasets/CensusData.csv'
+    store_file = data_cache.cache_path("timeseries", extension=".npz")
+
+    # The merged frame only depends on the geo and census files here
+    key = data_cache.source_key([geofile, censusfile])
+    cached = None
+    if not rebuild and os.path.exists(store_file):
+        cached = data_cache.load_frames(["incremental_merged"], key)
+
+    if cached is None:
+        merged_data, casesdataset, deathsdataset = get_merged(rebuild=rebuild)
+        store = TimeSeriesStore.from_frames(casesdataset, deathsdataset)
+        store.save(store_file)
+        data_cache.save_frames({"incremental_merged": merged_data}, key)
+        TimeSeriesArchive.write(store)
+        return merged_data, store
+
+    merged_data = cached[0]
+    store = TimeSeriesStore.load(store_file)
+    if ingest_new_dates(store, merged_data) > 0:
+        store.save(store_file)
+        data_cache.save_frames({"incremental_merged": merged_data}, key)
+    TimeSeriesArchive.update(store)
+
+    return merged_data, store
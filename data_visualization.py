@@ -2,40 +2,116 @@
 Creates geospatial plots for states and the US.
 '''
 
-from matplotlib import pyplot as plt
-import pandas as pd
+import os
+import sys
 
-from data_imports import get_merged
+from data_imports import geometry_levels
+from data_imports import state_geometries
+import instrument
+from instrument import instrumented
 
-from statistics import get_statistics
+from jobs import run_jobs
 
-from timeseries import county_timeseries
-from timeseries import state_timeseries
+import render_cache
 
+# Plots are only saved to files, so matplotlib never opens a window.
+# matplotlib itself is imported by the functions that plot.
+os.environ.setdefault("MPLBACKEND", "Agg")
 
-def population_graphs(coronadata, place, type, par):
+# Reports made by main, in the job spec format of jobs.py
+DEFAULT_JOBS = {
+    "counties": [["King", "Washington"]],
+    "states": ["Washington"],
+    "maps": [{"place": ["US", "Washington"], "type": "Normalized",
+              "par": "Density"}],
+    "statistics": [{"para": "Density"}]}
+
+
+def us_state_data(coronadata, states=None):
     '''
-    This function takes a dataframe of coronavirus cases
-    by country and returns 3 plots.
-    1. A plot of the population by location (State or Country level)
-    2. A plot of the reported cases by location
-    3. A plot of the reported deaths by location
-    If type = None & par = None, returns a non-normalized set of graphs.
-    If type = "Normalized" & par = None,
-    returns a population-normalized set of graphs.
-    If type = "Normalized" & par = "Density",
-    returns a population density-normalized set of graphs.
+    This function takes the merged county dataframe and returns
+    a geodataframe with one row per state, indexed by state name,
+    holding the state boundary and the summed population,
+    cases, deaths and area of its counties.
+    states can give the result of state_geometries if it is
+    already at hand.
+    '''
+    if states is None:
+        states = state_geometries(coronadata)
+
+    # Sums the numbers with a groupby instead of a full dissolve
+    grouped = coronadata.groupby('STATEFP')
+    sums = grouped[['POPESTIMATE2019', 'Cases', 'Deaths', 'area_km2']].sum()
+    sums['Province_State'] = grouped['Province_State'].first()
+
+    location_data = states.join(sums, how='inner').reset_index()
+
+    return location_data.set_index('Province_State')
+
+
+def detail_level(bounds):
+    '''
+    This function takes the (minx, miny, maxx, maxy) bounds of
+    a map in degrees and returns the level of detail to draw it
+    at: "national", "state" or "county".
+    '''
+    minx, miny, maxx, maxy = bounds
+    extent = max(maxx - minx, maxy - miny)
+    if extent > 20:
+        return "national"
+    elif extent > 3:
+        return "state"
+
+    return "county"
+
+
+def map_geometry(location_data, levels, key):
+    '''
+    This function takes the rows of a map, the dictionary of
+    simplified geometry from data_imports.geometry_levels and
+    the column matching the two, and returns the geometry of
+    the rows at the level of detail suited to their extent.
+    '''
+    level = detail_level(location_data.total_bounds)
+    geometry = levels[level].reindex(location_data[key])
+    geometry.index = location_data.index
+
+    return geometry
+
+
+def map_data(coronadata, place):
+    '''
+    This function takes the merged county dataframe and a place
+    ("US" or a state name) and returns (location_data, geometry):
+    the rows of the map and their geometry at the level of detail
+    suited to the map. Several maps of the same place can share it.
+    Raises a KeyError if the place is not in the data.
     '''
-    # this is the folder name
-    folder = 'Project datasets/Geo_graphs/'
-    pd.options.mode.chained_assignment = None
     if place == "US":
-        location_data = coronadata[['geometry', 'Province_State',
-                                    'POPESTIMATE2019', 'Cases', 'Deaths']]
-        location_data = location_data.dissolve(by="Province_State",
-                                               aggfunc='sum')
+        states = state_geometries(coronadata)
+        location_data = us_state_data(coronadata, states)
+        levels = geometry_levels(states.reset_index(), 'STATEFP', "state")
+        geometry = map_geometry(location_data, levels, 'STATEFP')
     else:
         location_data = coronadata.loc[coronadata["Province_State"] == place]
+        if len(location_data) == 0:
+            raise KeyError("Unknown place: " + place)
+        levels = geometry_levels(coronadata, 'FIPS', "county")
+        geometry = map_geometry(location_data, levels, 'FIPS')
+
+    return location_data, geometry
+
+
+def map_layers(location_data, place, type, par):
+    '''
+    This function takes the rows of a map, the place and the
+    type and par options of population_graphs and returns a list
+    of (values, title, file name, color limits) tuples, one for
+    each of the population, cases and deaths maps.
+    The file names have no folder or extension.
+    '''
+    # Copies so the shared rows are not changed
+    location_data = location_data.copy()
 
     if type == "Normalized":
 
@@ -52,91 +128,98 @@ def population_graphs(coronadata, place, type, par):
         deaths_mean = location_data["NormDeaths"].mean()
 
         if par == "Density":
-            location_data['area'] = location_data['geometry'].\
-                                    to_crs({'init': 'epsg:3395'}).\
-                                    map(lambda p: p.area / (4*10**6))
             location_data["NormCases"] = location_data["NormCases"] / \
-                location_data['area']
+                location_data['area_km2']
             case_mean = location_data['NormCases'].mean()
             location_data["NormDeaths"] = location_data["NormDeaths"] / \
-                location_data['area']
+                location_data['area_km2']
             deaths_mean = location_data["NormDeaths"].mean()
 
-        # plot the output
-        location_data.plot(column='POPESTIMATE2019', legend=True)
-        plt.title(place + ' Population')
-        plt.xticks([])
-        plt.yticks([])
-        plt.savefig(folder + 'Population.png')
-
-        location_data.plot(column="NormCases", legend=True,
-                           clim=(0, 1.5 * case_mean))
-        if par == 'Density':
-            plt.title(place + ' Cases per 100,000 people/square mile')
-        else:
-            plt.title(place + ' Cases per 100,000 people')
-        plt.xticks([])
-        plt.yticks([])
-        plt.savefig(folder + 'Cases.png')
-
-        location_data.plot(column='NormDeaths', legend=True,
-                           clim=(0, 1.5 * deaths_mean))
         if par == 'Density':
-            plt.title(place + ' Deaths per 100,000 people/square mile')
+            cases_title = place + ' Cases per 100,000 people/square km'
+            deaths_title = place + ' Deaths per 100,000 people/square km'
         else:
-            plt.title(place + ' Deaths per 100,000 people')
-        plt.xticks([])
-        plt.yticks([])
-        plt.savefig(folder + 'Deaths.png')
-
-    else:
-        location_data.plot(column='POPESTIMATE2019', legend=True)
-        plt.title(place + ' Population')
-        plt.xticks([])
-        plt.yticks([])
-        plt.savefig(folder + 'Population.png')
-
-        location_data.plot(column='Cases', legend=True)
-        plt.title(place + ' Reported Cases')
-        plt.xticks([])
-        plt.yticks([])
-        plt.savefig(folder + 'Reported_Cases.png')
+            cases_title = place + ' Cases per 100,000 people'
+            deaths_title = place + ' Deaths per 100,000 people'
+
+        return [(location_data['POPESTIMATE2019'], place + ' Population',
+                 'Population', None),
+                (location_data["NormCases"], cases_title, 'Cases',
+                 (0, 1.5 * case_mean)),
+                (location_data["NormDeaths"], deaths_title, 'Deaths',
+                 (0, 1.5 * deaths_mean))]
+
+    return [(location_data['POPESTIMATE2019'], place + ' Population',
+             'Population', None),
+            (location_data['Cases'], place + ' Reported Cases',
+             'Reported_Cases', None),
+            (location_data['Deaths'], place + ' Reported Deaths',
+             'Reported_Deaths', None)]
+
+
+@instrumented
+def population_graphs(coronadata, place, type, par,
+                      folder='Project datasets/Geo_graphs/', prepared=None,
+                      use_cache=True):
+    '''
+    This function takes a dataframe of coronavirus cases
+    by country and returns 3 plots.
+    1. A plot of the population by location (State or Country level)
+    2. A plot of the reported cases by location
+    3. A plot of the reported deaths by location
+    If type = None & par = None, returns a non-normalized set of graphs.
+    If type = "Normalized" & par = None,
+    returns a population-normalized set of graphs.
+    If type = "Normalized" & par = "Density",
+    returns a population density-normalized set of graphs.
+    The plots are saved in folder. prepared optionally holds the
+    (location_data, geometry) of the place from map_data.
+    If use_cache = True, maps already drawn from the same data
+    are taken from render_cache instead of being drawn again.
+    Returns True if the maps were drawn and False if they were
+    taken from render_cache.
+    '''
+    if prepared is None:
+        prepared = map_data(coronadata, place)
+    location_data, geometry = prepared
 
-        location_data.plot(column='Deaths', legend=True)
-        plt.title(place + ' Reported Deaths')
-        plt.xticks([])
-        plt.yticks([])
-        plt.savefig(folder + 'Reported_Deaths.png')
+    layers = map_layers(location_data, place, type, par)
+    file_names = [folder + name + '.png' for values, title, name, clim
+                  in layers]
 
-    return
+    # Skips drawing when the same maps are cached
+    if use_cache:
+        key = render_cache.render_key(
+            "population_graphs", place=place, type=type, par=par,
+            data=render_cache.data_version(geometry.bounds, *[
+                part for layer in layers for part in layer]))
+        if render_cache.fetch(key, file_names):
+            return False
 
+    from choropleth import Choropleth
 
-def main():
-    merged_data_tuple = get_merged()
-    merged_data = merged_data_tuple[0]
-    casesdataset = merged_data_tuple[1]
-    deathsdataset = merged_data_tuple[2]
+    choropleth = Choropleth(geometry)
+    for (values, title, name, clim), file_name in zip(layers, file_names):
+        choropleth.draw(values, title, file_name, clim=clim)
 
-    # Parameters for location
-    county = "King"
-    state = "Washington"
+    # Frees the figure so memory stays flat across many maps
+    choropleth.close()
 
-    # For the county
-    county_timeseries(casesdataset, "Cases", county, state)
-    county_timeseries(deathsdataset, "Deaths", county, state)
-    population_graphs(merged_data, place="US", type="Normalized",
-                      par="Density")
+    if use_cache:
+        render_cache.store(key, file_names)
 
-    # For the state
-    state_timeseries(casesdataset, "Cases", state)
-    state_timeseries(deathsdataset, "Deaths", state)
+    return True
 
-    # Plots the population graphs
-    population_graphs(merged_data, place=state, type="Normalized",
-                      par="Density")
 
-    get_statistics(merged_data, para='Density')
+def main(rebuild=False):
+    # The county and state plots, both maps and the statistics,
+    # see jobs.py to run other reports
+    run_jobs(DEFAULT_JOBS, workers=1, rebuild=rebuild)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # --trace FILE writes the time of every stage to FILE
+    if "--trace" in sys.argv:
+        instrument.configure(sys.argv[sys.argv.index("--trace") + 1],
+                             "--trace-memory" in sys.argv)
+    main(rebuild="--rebuild" in sys.argv)
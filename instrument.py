@@ -0,0 +1,210 @@
+'''
+This file is responsible for optional timing and memory
+instrumentation of the pipeline stages.
+It is off unless the PIPELINE_TRACE environment variable (or
+the --trace option of data_visualization.py and jobs.py) names
+a file to write to. Each stage then adds one record with its
+wall time, CPU time, peak memory and row counts.
+A file ending in .json is written in the Chrome trace format,
+which chrome://tracing and https://ui.perfetto.dev can open;
+any other file gets one JSON object per line.
+PIPELINE_TRACE_MEMORY=1 also measures the peak memory Python
+allocates in each stage with tracemalloc, which is accurate but
+makes the stages several times slower.
+'''
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows
+    resource = None
+
+# File the records are written to, or None when tracing is off
+trace_file = None
+
+# Whether tracemalloc measures the peak memory of each stage
+trace_memory = False
+
+# Open stages of each thread, innermost last
+open_stages = threading.local()
+
+write_lock = threading.Lock()
+
+
+def configure(file_name=None, memory=None):
+    """
+    This function turns tracing on and writes the records to
+    file_name, or turns it off if file_name is None.
+    memory turns tracemalloc measurements on or off.
+    The settings are also put in the environment, so worker
+    processes started later trace to the same file.
+    """
+    global trace_file, trace_memory
+    trace_file = file_name
+    if memory is not None:
+        trace_memory = memory
+
+    if file_name is None:
+        os.environ.pop("PIPELINE_TRACE", None)
+        return
+
+    os.environ["PIPELINE_TRACE"] = file_name
+    os.environ["PIPELINE_TRACE_MEMORY"] = "1" if trace_memory else "0"
+
+    # The closing bracket of a Chrome trace is optional, so
+    # records can be appended by any process as they finish
+    if file_name.endswith(".json") and not os.path.exists(file_name):
+        with open(file_name, "w") as handle:
+            handle.write("[\n")
+
+
+def max_rss_mb():
+    """
+    This function returns the largest resident memory the
+    process has used so far in MB, or None where unknown.
+    """
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes and macOS bytes
+    if os.uname().sysname == "Darwin":
+        return usage / 2**20
+    return usage / 2**10
+
+
+def row_count(value):
+    """
+    This function returns the number of rows of a dataframe,
+    series or array, or None for other values.
+    A tuple counts the rows of its first value.
+    """
+    if isinstance(value, tuple) and value:
+        value = value[0]
+    if hasattr(value, "shape") and len(value.shape) > 0:
+        return int(value.shape[0])
+
+    return None
+
+
+def write_record(record):
+    """
+    This function appends one stage record to the trace file.
+    """
+    if trace_file.endswith(".json"):
+        event = {"name": record["stage"], "ph": "X", "pid": record["pid"],
+                 "tid": record["thread"], "ts": record["start"] * 10**6,
+                 "dur": record["wall_seconds"] * 10**6, "args": record}
+        line = json.dumps(event) + ",\n"
+    else:
+        line = json.dumps(record) + "\n"
+
+    with write_lock:
+        with open(trace_file, "a") as handle:
+            handle.write(line)
+
+
+class Stage:
+    """
+    This class measures one stage of the pipeline when used as
+    a context manager: with Stage("data_merge") as stage: ...
+    Setting stage.rows_in and stage.rows_out records row counts.
+    Nothing is measured while tracing is off.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.rows_in = None
+        self.rows_out = None
+
+    def __enter__(self):
+        if trace_file is None:
+            return self
+
+        stack = getattr(open_stages, "stack", None)
+        if stack is None:
+            stack = open_stages.stack = list()
+        self.depth = len(stack)
+        stack.append(self)
+
+        self.peak = 0
+        self.started = False
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self.started = True
+            # Keeps the peak of the enclosing stage before resetting
+            if self.depth > 0:
+                parent = stack[-2]
+                parent.peak = max(parent.peak,
+                                  tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        self.start = time.time()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+
+        return self
+
+    def __exit__(self, kind, error, traceback):
+        if trace_file is None or not hasattr(self, "wall"):
+            return False
+
+        wall = time.perf_counter() - self.wall
+        cpu = time.process_time() - self.cpu
+        stack = open_stages.stack
+        stack.pop()
+
+        traced = None
+        if trace_memory and tracemalloc.is_tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            traced = self.peak / 2**20
+            if stack:
+                stack[-1].peak = max(stack[-1].peak, self.peak)
+            if self.started:
+                tracemalloc.stop()
+
+        write_record({"stage": self.name, "start": self.start,
+                      "wall_seconds": wall, "cpu_seconds": cpu,
+                      "max_rss_mb": max_rss_mb(), "peak_traced_mb": traced,
+                      "rows_in": self.rows_in, "rows_out": self.rows_out,
+                      "depth": self.depth, "pid": os.getpid(),
+                      "thread": threading.get_ident(),
+                      "error": None if kind is None else kind.__name__})
+
+        return False
+
+
+def instrumented(function):
+    """
+    This function is a decorator that records every call of
+    function as a Stage named after it. The rows of the first
+    argument and of the result are recorded when they have any.
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if trace_file is None:
+            return function(*args, **kwargs)
+
+        with Stage(function.__name__) as stage:
+            if args:
+                stage.rows_in = row_count(args[0])
+            result = function(*args, **kwargs)
+            stage.rows_out = row_count(result)
+
+        return result
+
+    return wrapper
+
+
+# Picks up tracing from the environment, including in worker processes
+if os.environ.get("PIPELINE_TRACE"):
+    configure(os.environ["PIPELINE_TRACE"],
+              os.environ.get("PIPELINE_TRACE_MEMORY", "0") == "1")
@@ -0,0 +1,317 @@
+'''
+This file is responsible for running many reports in one
+process from a job spec, instead of editing main() in
+data_visualization for every new report.
+The dataset is loaded once, work shared between jobs (the
+state aggregates and the rows and geometry of each map) is
+done once, duplicate jobs are dropped, and the jobs are run
+by a pool of worker processes.
+
+Usage: python jobs.py spec.json [--workers N] [--rebuild]
+
+A spec is a JSON (or YAML, if PyYAML is installed) file such as:
+{
+    "kinds": ["Cases", "Deaths"],
+    "counties": [["King", "Washington"]],
+    "states": ["Washington", "Oregon"],
+    "maps": [{"place": "US", "type": "Normalized", "par": "Density"}],
+    "statistics": [{"para": "Density", "cases": "Cases"}],
+    "workers": 4
+}
+A map or statistics entry may list several places or values
+in one field, for example "place": ["US", "Washington"].
+'''
+
+import argparse
+import itertools
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import instrument
+
+# Plots are only saved to files, so matplotlib never opens a window
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+# Folders each task saves its plots in by default
+DEFAULT_FOLDERS = {"population_graphs": "Project datasets/Geo_graphs/",
+                   "get_statistics": "Project datasets/Statistics/"}
+
+# Options that hold a list of values for one job
+LIST_OPTIONS = ("bins", "labels", "quantiles")
+
+# The data of the current worker process
+worker_data = None
+
+
+def load_spec(file_name):
+    """
+    This function takes the file name of a JSON or YAML
+    job spec and returns it as a dictionary.
+    """
+    with open(file_name) as handle:
+        if file_name.endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("Reading YAML job specs needs PyYAML, "
+                                  "or write the spec as JSON")
+            return yaml.safe_load(handle)
+
+        return json.load(handle)
+
+
+def expand_entry(entry):
+    """
+    This function takes a map or statistics entry of a spec
+    and returns one dictionary per combination of the values
+    given as lists, other than the options in LIST_OPTIONS.
+    """
+    names = list(entry)
+    values = [value if isinstance(value, list) and name not in LIST_OPTIONS
+              else [value] for name, value in entry.items()]
+
+    return [dict(zip(names, combination))
+            for combination in itertools.product(*values)]
+
+
+def job_key(job):
+    """
+    This function takes a job and returns a hashable key,
+    equal for jobs that do the same work.
+    """
+    items = list()
+    for name, value in sorted(job.items()):
+        if isinstance(value, list):
+            value = tuple(value)
+        items.append((name, value))
+
+    return tuple(items)
+
+
+def job_name(job):
+    """
+    This function takes a job and returns a short readable name.
+    """
+    values = [str(value) for name, value in job.items()
+              if name not in ("task", "folder") and value is not None]
+
+    return job["task"] + "(" + ", ".join(values) + ")"
+
+
+def expand_jobs(spec):
+    """
+    This function takes a job spec and returns the list of jobs
+    it describes, in order, with duplicate jobs removed.
+    Each job is a dictionary with the task to run and its
+    keyword arguments.
+    """
+    kinds = spec.get("kinds", ["Cases", "Deaths"])
+
+    jobs = list()
+    for place in spec.get("counties", []):
+        if isinstance(place, dict):
+            county, state = place["county"], place["state"]
+        else:
+            county, state = place
+        for kind in kinds:
+            jobs.append({"task": "county_timeseries", "kind": kind,
+                         "county": county, "state": state})
+
+    for state in spec.get("states", []):
+        for kind in kinds:
+            jobs.append({"task": "state_timeseries", "kind": kind,
+                         "state": state})
+
+    for entry in spec.get("maps", []):
+        for options in expand_entry(entry):
+            jobs.append({"task": "population_graphs",
+                         "place": options["place"],
+                         "type": options.get("type"),
+                         "par": options.get("par")})
+
+    for entry in spec.get("statistics", []):
+        for options in expand_entry(entry):
+            job = {"task": "get_statistics"}
+            job.update(options)
+            jobs.append(job)
+
+    # Drops jobs that repeat an earlier one
+    unique = dict()
+    for job in jobs:
+        unique.setdefault(job_key(job), job)
+    removed = len(jobs) - len(unique)
+    if removed > 0:
+        print("Removed " + str(removed) + " duplicate jobs")
+
+    return assign_folders(list(unique.values()))
+
+
+def assign_folders(jobs):
+    """
+    This function takes a list of jobs and gives every map or
+    statistics job its own subfolder when several jobs of that
+    task would otherwise overwrite each other's plots.
+    Jobs with a folder of their own keep it.
+    """
+    for task, folder in DEFAULT_FOLDERS.items():
+        shared = [job for job in jobs
+                  if job["task"] == task and "folder" not in job]
+        if len(shared) < 2:
+            continue
+        for job in shared:
+            name = job_name(job)[len(task):]
+            job["folder"] = folder + re.sub(r"[^0-9A-Za-z]+", "_",
+                                            name).strip("_") + "/"
+
+    return jobs
+
+
+def shared_work(merged_data, jobs):
+    """
+    This function takes the merged data and the jobs and
+    returns a dictionary from place to the (location_data,
+    geometry) of its maps, built once for all map jobs.
+    """
+    from data_visualization import map_data
+
+    prepared = dict()
+    for job in jobs:
+        if job["task"] == "population_graphs" and \
+                job["place"] not in prepared:
+            prepared[job["place"]] = map_data(merged_data, job["place"])
+
+    return prepared
+
+
+def init_worker(data):
+    """
+    This function runs once in every worker process.
+    It keeps the (merged_data, cube, prepared) data for the
+    tasks of that worker and switches matplotlib to the
+    non-interactive Agg backend.
+    """
+    global worker_data
+    worker_data = data
+
+    from matplotlib import pyplot as plt
+    plt.switch_backend("Agg")
+
+
+def run_job(job):
+    """
+    This function takes a job, runs it with the worker's data
+    and returns (name, seconds).
+    """
+    from data_visualization import population_graphs
+    from statistics import get_statistics
+    from timeseries import county_timeseries
+    from timeseries import state_timeseries
+
+    merged_data, cube, prepared = worker_data
+    options = {name: value for name, value in job.items() if name != "task"}
+    if "folder" in options:
+        os.makedirs(options["folder"], exist_ok=True)
+
+    start = time.perf_counter()
+    # Names the records of the stages this job runs when tracing
+    with instrument.Stage(job_name(job)):
+        if job["task"] == "county_timeseries":
+            county_timeseries(cube, options["kind"], options["county"],
+                              options["state"])
+        elif job["task"] == "state_timeseries":
+            state_timeseries(cube, options["kind"], options["state"])
+        elif job["task"] == "population_graphs":
+            population_graphs(merged_data, prepared=prepared[options["place"]],
+                              **options)
+        elif job["task"] == "get_statistics":
+            get_statistics(merged_data, **options)
+        else:
+            raise ValueError("Unknown task: " + str(job["task"]))
+
+    return job_name(job), time.perf_counter() - start
+
+
+def run_jobs(spec, workers=None, rebuild=False):
+    """
+    This function takes a job spec (a dictionary or a file name)
+    and runs all of its jobs. The dataset is loaded once and
+    workers is the number of processes, taken from the spec or
+    defaulting to the number of CPUs. workers = 1 runs the jobs
+    in this process.
+    Prints a timing summary and returns a list of (name, seconds)
+    tuples, one per job.
+    """
+    from data_imports import get_merged
+    from metric_cube import MetricCube
+
+    if isinstance(spec, str):
+        spec = load_spec(spec)
+    jobs = expand_jobs(spec)
+    if workers is None:
+        workers = spec.get("workers") or os.cpu_count() or 1
+
+    start = time.perf_counter()
+    merged_data, casesdataset, deathsdataset = get_merged(rebuild=rebuild)
+    # Cases, deaths and their daily metrics of every place in one array
+    cube = MetricCube.from_frames(casesdataset, deathsdataset)
+    prepared = shared_work(merged_data, jobs)
+    setup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    data = (merged_data, cube, prepared)
+    if workers == 1:
+        init_worker(data)
+        timings = [run_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                                 initargs=(data,)) as executor:
+            timings = list(executor.map(run_job, jobs))
+    total = time.perf_counter() - start
+
+    print_summary(timings, setup, total, workers)
+
+    return timings
+
+
+def print_summary(timings, setup, total, workers):
+    """
+    This function prints the seconds taken by every job, the
+    shared setup and the whole run.
+    """
+    width = max([len(name) for name, seconds in timings] + [10])
+    print("Loading and shared work".ljust(width) + "  " +
+          str(round(setup, 2)).rjust(8) + " s")
+    for name, seconds in timings:
+        print(name.ljust(width) + "  " + str(round(seconds, 2)).rjust(8) +
+              " s")
+    print(str(len(timings)) + " jobs on " + str(workers) + " workers took " +
+          str(round(total, 2)) + " s (" +
+          str(round(sum(seconds for name, seconds in timings), 2)) +
+          " s of job time)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runs the jobs of a spec")
+    parser.add_argument("spec", help="JSON or YAML job spec")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="rebuild the dataset cache")
+    parser.add_argument("--trace", default=None,
+                        help="file to write stage timings to, see "
+                        "instrument.py")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="also trace the peak memory of each stage")
+    arguments = parser.parse_args()
+
+    if arguments.trace:
+        instrument.configure(arguments.trace, arguments.trace_memory)
+
+    run_jobs(arguments.spec, arguments.workers, arguments.rebuild)
+
+
+if __name__ == "__main__":
+    main()
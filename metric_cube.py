@@ -0,0 +1,186 @@
+'''
+This file is responsible for holding the cases, deaths and
+their derived metrics of every county and state in one
+regions x days x metrics array.
+The regions share one metadata table and one index, so a
+single lookup returns every metric of a county or state.
+'''
+
+import numpy as np
+import pandas as pd
+
+from analytics import METRICS as DERIVED_METRICS
+from analytics import get_analytics
+from timeseries_store import TimeSeriesStore
+
+# Cumulative metrics, each followed in the cube by its derived
+# metrics from analytics, named like "Cases avg7"
+KINDS = ("Cases", "Deaths")
+
+
+class MetricCube:
+    """
+    This class holds values, a C-contiguous float64 array of
+    shape (regions, days, metrics), with a DatetimeIndex of the
+    days, the list of metric names and a metadata dataframe with
+    the FIPS, Admin2, Province_State and Population of every
+    region. The counties come first, in the order of the
+    TimeSeriesStore, followed by one row of totals per state.
+    It can be used in place of a TimeSeriesStore by
+    county_timeseries and state_timeseries, and in place of the
+    cases and deaths dataframes by data_imports.data_merge.
+    """
+
+    def __init__(self, metadata, dates, metrics, values, counties):
+        self.metadata = metadata
+        self.dates = dates
+        self.metrics = list(metrics)
+        self.values = values
+        self.counties = counties
+        self.population = metadata["Population"].to_numpy(dtype=np.float64)
+
+        # Shared index from (state, county) or state to region row
+        keys = zip(metadata["Province_State"][:counties],
+                   metadata["Admin2"][:counties])
+        self.rows = dict()
+        for row, key in enumerate(keys):
+            self.rows.setdefault(key, row)
+        self.state_rows = dict(
+            (state, row) for row, state in enumerate(
+                metadata["Province_State"][counties:], counties))
+
+        # State rows share the region axis with the counties
+        self.state_population = self.population
+
+    @classmethod
+    def from_store(cls, store):
+        """
+        This function takes a TimeSeriesStore and returns a cube
+        of its cases and deaths and their analytics metrics.
+        """
+        analytics = get_analytics(store)
+        cumulative = {"county": {"Cases": store.cases,
+                                 "Deaths": store.deaths},
+                      "state": {"Cases": store.state_cases,
+                                "Deaths": store.state_deaths}}
+
+        metrics = list()
+        for kind in KINDS:
+            metrics.append(kind)
+            metrics.extend(kind + " " + metric for metric in DERIVED_METRICS)
+
+        counties = len(store.metadata)
+        values = np.empty((counties + len(store.states), len(store.dates),
+                           len(metrics)))
+        for level, rows in [("county", slice(None, counties)),
+                            ("state", slice(counties, None))]:
+            for kind in KINDS:
+                position = metrics.index(kind)
+                values[rows, :, position] = cumulative[level][kind]
+                for metric in DERIVED_METRICS:
+                    values[rows, :, position + 1 +
+                           DERIVED_METRICS.index(metric)] = \
+                        analytics[level][kind][metric]
+
+        # Built from the columns, as concatenating the all-NA state
+        # rows to the counties is deprecated in pandas
+        states = len(store.states)
+        metadata = pd.DataFrame({
+            "FIPS": list(store.metadata["FIPS"]) + [pd.NA] * states,
+            "Admin2": list(store.metadata["Admin2"]) + [None] * states,
+            "Province_State": list(store.metadata["Province_State"]) +
+            list(store.states),
+            "Population": np.r_[store.metadata["Population"]
+                                .to_numpy(dtype=np.float64),
+                                store.state_population]})
+
+        return cls(metadata, store.dates, metrics, values, counties)
+
+    @classmethod
+    def from_frames(cls, cases_data, deaths_data):
+        """
+        This function takes the cases and deaths dataframes
+        from data_imports.get_merged and returns a cube.
+        """
+        return cls.from_store(TimeSeriesStore.from_frames(cases_data,
+                                                          deaths_data))
+
+    def row(self, county, state):
+        """
+        This function takes a county and state name and
+        returns the region row of that county.
+        """
+        try:
+            return self.rows[(state, county)]
+        except KeyError:
+            raise KeyError(county + ", " + state + " is not in the data")
+
+    def region(self, state, county=None):
+        """
+        This function takes a state and optionally a county and
+        returns the region row of the county, or of the state's
+        totals if county is None.
+        """
+        if county is not None:
+            return self.row(county, state)
+
+        try:
+            return self.state_rows[state]
+        except KeyError:
+            raise KeyError(state + " is not in the data")
+
+    def lookup(self, state, county=None):
+        """
+        This function takes a state and optionally a county and
+        returns a dataframe of every metric of that region, with
+        one row per day, without copying.
+        """
+        return pd.DataFrame(self.values[self.region(state, county)],
+                            index=self.dates, columns=self.metrics,
+                            copy=False)
+
+    def series(self, metric, row):
+        """
+        This function takes a metric name and a region row and
+        returns that metric as a series indexed by date, without
+        copying.
+        """
+        try:
+            position = self.metrics.index(metric)
+        except ValueError:
+            raise KeyError(metric)
+
+        return pd.Series(self.values[row, :, position], index=self.dates,
+                         copy=False)
+
+    def county_series(self, kind, county, state):
+        """
+        This function takes a metric such as "Cases", a county
+        and a state and returns the county's series by date.
+        """
+        return self.series(kind, self.row(county, state))
+
+    def state_series(self, kind, state):
+        """
+        This function takes a metric such as "Cases" and a state
+        and returns the state's summed series by date.
+        """
+        return self.series(kind, self.region(state))
+
+    def newest(self, kind):
+        """
+        This function takes a metric such as "Cases" and returns
+        a dataframe with the FIPS, Province_State and Admin2 of
+        every county and its value on the newest day in a column
+        named after the metric.
+        """
+        try:
+            position = self.metrics.index(kind)
+        except ValueError:
+            raise KeyError(kind)
+
+        columns = ["FIPS", "Province_State", "Admin2"]
+        newest = self.metadata[columns][:self.counties].copy()
+        newest[kind] = self.values[:self.counties, -1, position]
+
+        return newest
@@ -0,0 +1,170 @@
+'''
+This file is responsible for caching rendered plots so that
+a plot whose data and parameters did not change is not drawn
+again.
+Each plot is stored in 'Project datasets/Cache/Renders' under
+a name made from the hash of the renderer, its parameters and
+the data it draws, and is copied to its usual file name.
+The folder is kept under a size limit by removing the least
+recently used plots.
+'''
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+import data_cache
+
+RENDER_FOLDER = data_cache.CACHE_FOLDER + "Renders/"
+
+# Bump this when the look of the plots changes. Version 1 plots
+# were hard linked to their usual file names, so drawing over those
+# names could have changed them.
+RENDER_VERSION = 2
+
+# Largest total size of the cached plots in bytes
+MAX_BYTES = 256 * 2**20
+
+# Share of max_bytes the cached plots are cut down to when over it,
+# so the folder is scanned once per tenth of the limit written
+EVICT_TO = 0.9
+
+# Size of each render folder as last measured by evict plus the
+# plots stored since, so the folder is only scanned near the limit.
+# Plots stored by other processes are not counted until a scan.
+folder_bytes = dict()
+
+
+def data_version(*values):
+    """
+    This function takes any number of series, dataframes,
+    arrays or plain values and returns a hash string that
+    changes whenever any of them changes.
+    """
+    digest = hashlib.sha256()
+    for value in values:
+        if isinstance(value, (pd.Series, pd.DataFrame)):
+            hashed = pd.util.hash_pandas_object(value, index=True)
+            digest.update(hashed.to_numpy().tobytes())
+        elif hasattr(value, "tobytes"):
+            digest.update(value.tobytes())
+        else:
+            digest.update(repr(value).encode())
+
+    return digest.hexdigest()
+
+
+def render_key(function, **parameters):
+    """
+    This function takes the name of a renderer and the
+    parameters that decide what it draws (including a
+    data_version of its data) and returns the key of the plot.
+    """
+    text = json.dumps({"version": RENDER_VERSION, "function": function,
+                       "parameters": parameters}, sort_keys=True, default=str)
+
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def cached_name(key, file_name, folder=RENDER_FOLDER):
+    """
+    This function returns the content-addressed file a plot
+    with the given key and usual file name is stored under.
+    """
+    return folder + key[:32] + "_" + os.path.basename(file_name)
+
+
+def place(source, file_name):
+    """
+    This function copies the plot source to file_name through
+    a temporary file, so file_name is never half written.
+    Plots are copied rather than linked, so drawing over a usual
+    file name later never changes a cached plot.
+    """
+    descriptor, temporary = tempfile.mkstemp(
+        suffix=".tmp", dir=os.path.dirname(file_name) or ".")
+    os.close(descriptor)
+    try:
+        shutil.copyfile(source, temporary)
+        os.replace(temporary, file_name)
+    except OSError:
+        os.remove(temporary)
+        raise
+
+
+def fetch(key, file_names, folder=RENDER_FOLDER):
+    """
+    This function takes the key of a render and the list of
+    file names it writes. If every one of them is cached, puts
+    them at those file names and returns True, otherwise
+    returns False and the plots have to be drawn.
+    """
+    cached = [cached_name(key, file_name, folder) for file_name in file_names]
+    try:
+        if all(os.path.exists(name) for name in cached):
+            for name, file_name in zip(cached, file_names):
+                place(name, file_name)
+                # Marks the plot as recently used for eviction
+                os.utime(name)
+            return True
+    except FileNotFoundError:
+        # Another process evicted the plot in the meantime
+        pass
+
+    return False
+
+
+def store(key, file_names, folder=RENDER_FOLDER, max_bytes=MAX_BYTES):
+    """
+    This function takes the key of a render and the list of
+    file names it just wrote, stores the plots in the cache
+    and evicts old plots to stay within max_bytes. The folder
+    is only scanned when the plots may be over the limit.
+    """
+    os.makedirs(folder, exist_ok=True)
+    added = 0
+    for file_name in file_names:
+        cached = cached_name(key, file_name, folder)
+        place(file_name, cached)
+        added += os.path.getsize(cached)
+
+    # The first store of a process scans the folder once
+    if folder in folder_bytes:
+        folder_bytes[folder] += added
+    if folder_bytes.get(folder, max_bytes + 1) > max_bytes:
+        evict(int(max_bytes * EVICT_TO), folder)
+
+
+def evict(max_bytes=MAX_BYTES, folder=RENDER_FOLDER):
+    """
+    This function removes the least recently used plots
+    until the cached plots take at most max_bytes.
+    Returns the number of plots removed.
+    """
+    if not os.path.isdir(folder):
+        folder_bytes[folder] = 0
+        return 0
+
+    entries = [entry for entry in os.scandir(folder) if entry.is_file()]
+    total = sum(entry.stat().st_size for entry in entries)
+    entries.sort(key=lambda entry: entry.stat().st_mtime_ns)
+
+    removed = 0
+    for entry in entries:
+        if total <= max_bytes:
+            break
+        total -= entry.stat().st_size
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            # Another process removed it first
+            continue
+        removed += 1
+
+    folder_bytes[folder] = total
+
+    return removed
@@ -0,0 +1,197 @@
+'''
+This file is responsible for resampling-based significance
+testing of correlations, such as between population density
+and cases per 100,000 people.
+Bootstrap and permutation replicates are computed in batches
+as NumPy matrix operations on index matrices, optionally
+spread across a pool of processes.
+'''
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.stats import rankdata
+
+ResamplingResult = namedtuple("ResamplingResult", [
+    "method", "statistic", "ci_low", "ci_high", "confidence", "p_value",
+    "n", "bootstrap", "permutations"])
+ResamplingResult.__doc__ = """
+The result of correlation_test: the correlation of the data,
+its bootstrap percentile confidence interval, the two-sided
+permutation p-value, the number of data points, and the arrays
+of bootstrap and permutation replicates.
+"""
+
+# Largest number of values held at once by one batch
+BATCH_VALUES = 2 ** 23
+
+
+def pearson_rows(x, y):
+    """
+    This function takes two (replicates, n) arrays and returns
+    the Pearson correlation of every pair of rows.
+    Rows with no variance give NaN.
+    """
+    x = x - x.mean(axis=1, keepdims=True)
+    y = y - y.mean(axis=1, keepdims=True)
+    numerator = np.einsum("ij,ij->i", x, y)
+    denominator = np.sqrt(np.einsum("ij,ij->i", x, x) *
+                          np.einsum("ij,ij->i", y, y))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return numerator / denominator
+
+
+def kendall_rows(x, y, pairs):
+    """
+    This function takes two (replicates, n) arrays and the
+    (first, second) index arrays of every pair of positions,
+    and returns Kendall's tau-b of every pair of rows.
+    """
+    dx = np.sign(x[:, pairs[0]] - x[:, pairs[1]])
+    dy = np.sign(y[:, pairs[0]] - y[:, pairs[1]])
+    numerator = np.einsum("ij,ij->i", dx, dy)
+    denominator = np.sqrt(np.einsum("ij,ij->i", dx, dx) *
+                          np.einsum("ij,ij->i", dy, dy))
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return numerator / denominator
+
+
+def correlation_rows(method, x, y, pairs=None, ranked=False):
+    """
+    This function takes the method (pearson, spearman or kendall)
+    and two (replicates, n) arrays and returns the correlation of
+    every pair of rows. ranked = True means x and y already hold
+    ranks, so Spearman does not rank them again.
+    """
+    if method == "pearson":
+        return pearson_rows(x, y)
+    elif method == "spearman":
+        if not ranked:
+            x = rankdata(x, axis=1)
+            y = rankdata(y, axis=1)
+        return pearson_rows(x, y)
+    elif method == "kendall":
+        return kendall_rows(x, y, pairs)
+
+    raise ValueError("Unknown correlation method: " + str(method))
+
+
+def batch_size(method, n):
+    """
+    This function returns how many replicates of n points
+    are computed together, so a batch stays within BATCH_VALUES.
+    """
+    if method == "kendall":
+        width = n * (n - 1) // 2
+    else:
+        width = n
+
+    return max(1, BATCH_VALUES // max(width, 1))
+
+
+def run_block(task):
+    """
+    This function takes a (kind, method, x, y, seed, size) task
+    and returns size bootstrap or permutation replicates of the
+    correlation, drawn with the given seed.
+    kind is "bootstrap" or "permutation".
+    """
+    kind, method, x, y, seed, size = task
+    rng = np.random.default_rng(seed)
+    n = len(x)
+
+    pairs = None
+    if method == "kendall":
+        pairs = np.triu_indices(n, 1)
+
+    # Spearman permutations can reuse the ranks of the data
+    ranked = False
+    if kind == "permutation" and method == "spearman":
+        x = rankdata(x)
+        y = rankdata(y)
+        ranked = True
+
+    replicates = np.empty(size)
+    step = batch_size(method, n)
+    for start in range(0, size, step):
+        count = min(step, size - start)
+        if kind == "bootstrap":
+            index = rng.integers(0, n, size=(count, n))
+            x_rows = x[index]
+        else:
+            index = rng.permuted(np.tile(np.arange(n), (count, 1)), axis=1)
+            x_rows = np.broadcast_to(x, (count, n))
+        replicates[start:start + count] = correlation_rows(
+            method, x_rows, y[index], pairs, ranked)
+
+    return replicates
+
+
+def replicates(kind, method, x, y, size, seed, workers=1, blocks=16):
+    """
+    This function returns size bootstrap or permutation
+    replicates of the correlation of x and y.
+    The replicates are split into a fixed number of blocks,
+    each with its own seed spawned from seed (an int or a
+    numpy SeedSequence), so the result is the same for any
+    number of workers. workers > 1 runs the blocks in a process pool.
+    """
+    blocks = max(1, min(blocks, size))
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+
+    sizes = [len(part) for part in np.array_split(np.arange(size), blocks)]
+    seeds = seed.spawn(blocks)
+    tasks = [(kind, method, x, y, block_seed, block_size)
+             for block_seed, block_size in zip(seeds, sizes)]
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(run_block, tasks))
+    else:
+        results = [run_block(task) for task in tasks]
+
+    return np.concatenate(results)
+
+
+def correlation_test(x, y, method="pearson", n_bootstrap=2000,
+                     n_permutations=2000, confidence=0.95, seed=None,
+                     workers=1):
+    """
+    This function takes two sequences of values and returns a
+    ResamplingResult with their correlation (pearson, spearman
+    or kendall tau-b), a bootstrap percentile confidence interval
+    and a two-sided permutation p-value.
+    Pairs with a missing value are dropped.
+    seed makes the result reproducible and workers spreads the
+    replicates across that many processes.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = ~(np.isnan(x) | np.isnan(y))
+    x = x[valid]
+    y = y[valid]
+    n = len(x)
+
+    pairs = np.triu_indices(n, 1) if method == "kendall" else None
+    statistic = correlation_rows(method, x[None, :], y[None, :], pairs)[0]
+
+    # Separate seeds for the bootstrap and the permutations
+    boot_seed, perm_seed = np.random.SeedSequence(seed).spawn(2)
+    bootstrap = replicates("bootstrap", method, x, y, n_bootstrap,
+                           boot_seed, workers)
+    permutations = replicates("permutation", method, x, y, n_permutations,
+                              perm_seed, workers)
+
+    tail = (1 - confidence) / 2
+    ci_low, ci_high = np.nanquantile(bootstrap, [tail, 1 - tail])
+
+    # Counts the data itself as one of the permutations
+    extreme = np.sum(np.abs(permutations) >= abs(statistic) - 1e-12)
+    p_value = (extreme + 1) / (n_permutations + 1)
+
+    return ResamplingResult(method, statistic, ci_low, ci_high, confidence,
+                            p_value, n, bootstrap, permutations)
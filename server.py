@@ -0,0 +1,370 @@
+'''
+This file is responsible for serving maps, time series and
+statistics to the dashboard from one long-running local process.
+The merged dataset and the time-series store are loaded once
+and kept in memory. Plots are rendered into memory by a bounded
+pool of worker processes and returned as PNG bytes, statistics
+are returned as JSON, and recent responses are kept in an LRU
+cache. Plots are never written to the Project datasets folders.
+The dataset, analytics and map geometry caches in the Cache
+subfolder are filled when the server starts, so requests only
+read them.
+
+Usage: python server.py [--port 8000] [--workers 2] [--cache 256]
+
+Endpoints (GET, options as query parameters):
+/map?place=US&type=Normalized&par=Density&layer=Cases
+    layer is Population, Cases or Deaths
+/timeseries?kind=Cases&state=Washington&county=King&plot=daily
+    county is optional and plot is cumulative, daily or normalized
+/statistics?para=Density&cases=Cases&quantiles=4
+    bins and labels may be given as comma separated lists
+'''
+
+import argparse
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qsl
+from urllib.parse import urlparse
+
+# Plots are only rendered into memory, so matplotlib never opens a window
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+# Position of each map layer in data_visualization.map_layers
+MAP_LAYERS = {"Population": 0, "Cases": 1, "Deaths": 2}
+
+# Accepted values of the query parameters that have a fixed set
+KINDS = ("Cases", "Deaths")
+PLOTS = ("cumulative", "daily", "normalized")
+PARAMETERS = ("Population", "Density")
+
+# The data of the current worker process
+worker_data = None
+
+
+class ResponseCache:
+    """
+    This class holds the most recently used responses, up to
+    size of them, and is safe to use from several threads.
+    """
+
+    def __init__(self, size=256):
+        self.size = size
+        self.responses = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        This function returns the response stored under key
+        and marks it as recently used, or None if there is none.
+        """
+        with self.lock:
+            if key not in self.responses:
+                return None
+            self.responses.move_to_end(key)
+            return self.responses[key]
+
+    def put(self, key, response):
+        """
+        This function stores a response under key, dropping
+        the least recently used response when the cache is full.
+        """
+        with self.lock:
+            self.responses[key] = response
+            self.responses.move_to_end(key)
+            while len(self.responses) > self.size:
+                self.responses.popitem(last=False)
+
+
+def init_worker(data):
+    """
+    This function runs once in every worker process.
+    It keeps the (merged_data, store, analytics) data for the
+    requests of that worker, along with the map rows and figures
+    it builds, and switches matplotlib to the non-interactive Agg
+    backend.
+    """
+    global worker_data
+    merged_data, store, analytics = data
+    worker_data = {"merged": merged_data, "store": store,
+                   "analytics": analytics, "maps": dict()}
+
+    from matplotlib import pyplot as plt
+    plt.switch_backend("Agg")
+
+
+def option(options, name, default=None, choices=None):
+    """
+    This function returns the query parameter name, or default
+    if it is not given. Raises ValueError, answered with 400,
+    if it is missing without a default or not one of choices.
+    """
+    value = options.get(name, default)
+    if value is None and default is None:
+        raise ValueError("Missing query parameter: " + name)
+    if choices is not None and value not in choices:
+        raise ValueError("Unknown " + name + ": " + str(value) +
+                         ", expected one of " + ", ".join(choices))
+
+    return value
+
+
+def option_list(text, convert=str):
+    """
+    This function takes a comma separated query value and
+    returns it as a list, or None if text is None.
+    """
+    if text is None:
+        return None
+
+    return [convert(value) for value in text.split(",")]
+
+
+def render_map(options):
+    """
+    This function takes the options of a /map request and
+    returns the PNG bytes of one population_graphs map.
+    The rows and figure of each place are built once per worker.
+    """
+    from choropleth import Choropleth
+    from data_visualization import map_data
+    from data_visualization import map_layers
+
+    place = option(options, "place", "US")
+    layer = option(options, "layer", "Cases", MAP_LAYERS)
+
+    if place not in worker_data["maps"]:
+        location_data, geometry = map_data(worker_data["merged"], place)
+        worker_data["maps"][place] = (location_data, Choropleth(geometry))
+    location_data, choropleth = worker_data["maps"][place]
+
+    layers = map_layers(location_data, place, options.get("type"),
+                        options.get("par"))
+    values, title, name, clim = layers[MAP_LAYERS[layer]]
+
+    output = io.BytesIO()
+    choropleth.draw(values, title, output, clim=clim)
+
+    return output.getvalue()
+
+
+def render_timeseries(options):
+    """
+    This function takes the options of a /timeseries request
+    and returns the PNG bytes of one county or state plot.
+    """
+    from timeseries import graph_cum_timeseries
+    from timeseries import graph_diff_timeseries
+    from timeseries import precomputed_daily
+
+    store = worker_data["store"]
+    kind = option(options, "kind", "Cases", KINDS)
+    state = option(options, "state")
+    county = options.get("county")
+    plot = option(options, "plot", "cumulative", PLOTS)
+
+    if county is None:
+        time_data = store.state_series(kind, state)
+        row = store.state_rows[state]
+        population = store.state_population[row] / 100000
+        level, place, name = "state", "State", state
+    else:
+        time_data = store.county_series(kind, county, state)
+        row = store.row(county, state)
+        population = store.population[row]
+        level, place, name = "county", "County", county
+
+    output = io.BytesIO()
+    if plot == "cumulative":
+        graph_cum_timeseries(time_data, kind, place, name, file_name=output)
+    elif plot == "daily":
+        daily, average = precomputed_daily(store, level, kind, row,
+                                           worker_data["analytics"])
+        graph_diff_timeseries(time_data, kind, place, name, daily, average,
+                              file_name=output)
+    elif plot == "normalized":
+        graph_cum_timeseries(time_data / population, "Normalized " + kind,
+                             place, name, file_name=output)
+    else:
+        raise ValueError("Unknown plot: " + plot)
+
+    return output.getvalue()
+
+
+def render_statistics(options):
+    """
+    This function takes the options of a /statistics request
+    and returns the get_statistics table and p-value as JSON
+    bytes, without drawing the boxplots.
+    """
+    import scipy.stats as stats
+
+    from statistics import binned_statistics
+    from statistics import grouped_metrics
+
+    data = worker_data["merged"]
+    para = option(options, "para", "Population", PARAMETERS)
+    cases = option(options, "cases", "Cases", KINDS)
+    quantiles = options.get("quantiles")
+    if quantiles is not None:
+        quantiles = int(quantiles)
+
+    parameter, groups, metrics = grouped_metrics(
+        data, para, option_list(options.get("bins"), float),
+        option_list(options.get("labels")), quantiles)
+    table = binned_statistics(metrics, groups)
+
+    norm_cases = metrics[cases + " per 100k"]
+    valid = parameter.notna() & norm_cases.notna()
+    s, p = stats.pearsonr(parameter[valid], norm_cases[valid])
+
+    rows = dict()
+    for group, row in table.iterrows():
+        rows[str(group)] = dict()
+        for (metric, statistic), value in row.items():
+            rows[str(group)].setdefault(metric, dict())[statistic] = \
+                None if value != value else float(value)
+
+    return json.dumps({"para": para, "cases": cases, "p_value": float(p),
+                       "groups": rows}).encode()
+
+
+def render(endpoint, options):
+    """
+    This function takes an endpoint name and its options, runs
+    in a worker process, and returns (content type, body bytes).
+    """
+    if endpoint == "map":
+        return "image/png", render_map(options)
+    elif endpoint == "timeseries":
+        return "image/png", render_timeseries(options)
+    elif endpoint == "statistics":
+        return "application/json", render_statistics(options)
+
+    raise LookupError("Unknown endpoint: " + endpoint)
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    This class answers one request, from the response cache
+    when possible and otherwise by rendering in the worker pool.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        endpoint = url.path.strip("/")
+        options = dict(parse_qsl(url.query))
+        for name, value in options.items():
+            if value == "None":
+                options[name] = None
+        key = (endpoint, tuple(sorted(options.items(), key=str)))
+
+        response = self.server.cache.get(key)
+        if response is None:
+            # Turns requests away instead of queueing without limit
+            if not self.server.pending.acquire(blocking=False):
+                self.send_error_json(503, "Too many requests in progress")
+                return
+            try:
+                future = self.server.pool.submit(render, endpoint, options)
+                response = future.result()
+            except LookupError as error:
+                self.send_error_json(404, str(error))
+                return
+            except (ValueError, TypeError) as error:
+                self.send_error_json(400, str(error))
+                return
+            except Exception as error:
+                self.send_error_json(500, repr(error))
+                return
+            finally:
+                self.server.pending.release()
+            self.server.cache.put(key, response)
+
+        content_type, body = response
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_error_json(self, status, message):
+        """
+        This function sends an error status with a JSON body.
+        """
+        body = json.dumps({"error": message}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def make_server(port=8000, workers=2, cache_size=256, rebuild=False,
+                host="127.0.0.1"):
+    """
+    This function loads the dataset once and returns an HTTP
+    server ready to serve_forever, with workers rendering
+    processes and an LRU cache of cache_size responses.
+    At most four requests per worker are rendered or waiting
+    at once; later ones get a 503 response.
+    """
+    from analytics import get_analytics
+    from data_imports import geometry_levels
+    from data_imports import get_merged
+    from data_imports import state_geometries
+    from timeseries_store import TimeSeriesStore
+
+    merged_data, casesdataset, deathsdataset = get_merged(rebuild=rebuild)
+    store = TimeSeriesStore.from_frames(casesdataset, deathsdataset)
+
+    # Computed and saved once here rather than by every worker,
+    # along with the map geometry that data_visualization.map_data reads
+    analytics = get_analytics(store)
+    states = state_geometries(merged_data)
+    geometry_levels(states.reset_index(), 'STATEFP', "state")
+    geometry_levels(merged_data, 'FIPS', "county")
+
+    server = ThreadingHTTPServer((host, port), RequestHandler)
+    server.pool = ProcessPoolExecutor(max_workers=workers,
+                                      initializer=init_worker,
+                                      initargs=((merged_data, store,
+                                                 analytics),))
+    server.cache = ResponseCache(cache_size)
+    server.pending = threading.BoundedSemaphore(workers * 4)
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serves maps, time series "
+                                     "and statistics on a local port")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=2,
+                        help="number of rendering processes")
+    parser.add_argument("--cache", type=int, default=256,
+                        help="number of responses to keep")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="rebuild the dataset cache")
+    arguments = parser.parse_args()
+
+    server = make_server(arguments.port, arguments.workers, arguments.cache,
+                         arguments.rebuild)
+    print("Serving on http://127.0.0.1:" + str(arguments.port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
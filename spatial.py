@@ -0,0 +1,287 @@
+'''
+This file is responsible for the spatial autocorrelation
+of county metrics: global Moran's I and local Moran's I
+(LISA) hotspots.
+The contiguity weights are built once from the county
+geometry with an STRtree spatial index, stored as a sparse
+matrix and cached on disk, so every statistic and every
+batch of permutations is a sparse matrix product.
+'''
+
+from collections import namedtuple
+import os
+
+import numpy as np
+import pandas as pd
+import shapely
+from scipy import sparse
+
+import data_cache
+
+MoranResult = namedtuple("MoranResult", [
+    "statistic", "expected", "p_value", "z_score", "n", "permutations"])
+MoranResult.__doc__ = """
+The result of morans_i: Moran's I of the data, its expected
+value with no spatial autocorrelation, the pseudo p-value and
+z-score from the permutations, the number of counties used
+and the array of permuted statistics.
+"""
+
+# Names of the LISA quadrants, in the usual 1 to 4 numbering
+QUADRANTS = {1: "High-High", 2: "Low-High", 3: "Low-Low", 4: "High-Low"}
+
+# Largest number of values held at once by one batch
+BATCH_VALUES = 2 ** 23
+
+
+def contiguity_pairs(geometry, kind="queen"):
+    """
+    This function takes a GeoSeries of polygons and returns the
+    (first, second) position arrays of every pair of neighbours.
+    kind = "queen" counts polygons sharing any boundary point as
+    neighbours and kind = "rook" only those sharing an edge.
+    Candidate pairs come from one bulk STRtree query.
+    """
+    geoms = np.asarray(geometry.values, dtype=object)
+    tree = shapely.STRtree(geoms)
+    first, second = tree.query(geoms, predicate="intersects")
+
+    # Keeps each pair once, without the polygon itself
+    keep = first < second
+    first = first[keep]
+    second = second[keep]
+
+    if kind == "rook":
+        shared = shapely.intersection(shapely.boundary(geoms[first]),
+                                      shapely.boundary(geoms[second]))
+        edge = shapely.length(shared) > 0
+        first = first[edge]
+        second = second[edge]
+    elif kind != "queen":
+        raise ValueError("Unknown contiguity kind: " + str(kind))
+
+    return first, second
+
+
+def contiguity_weights(geometry, kind="queen"):
+    """
+    This function takes a GeoSeries of polygons and returns a
+    symmetric binary scipy.sparse CSR matrix with a one for
+    every pair of neighbouring polygons (see contiguity_pairs).
+    """
+    first, second = contiguity_pairs(geometry, kind)
+    n = len(geometry)
+    rows = np.concatenate([first, second])
+    columns = np.concatenate([second, first])
+    values = np.ones(len(rows))
+
+    return sparse.csr_matrix((values, (rows, columns)), shape=(n, n))
+
+
+def county_weights(data, key="FIPS", kind="queen",
+                   geofile="Project datasets/tl_2019_us_county"):
+    """
+    This function takes a geodataframe of counties (such as the
+    merged data) and returns (weights, ids): the contiguity
+    weights of its counties and the key of each row and column.
+    The weights are cached and only rebuilt when the shapefile
+    changes or data holds counties missing from the cache.
+    """
+    name = "weights_" + kind
+    file_name = data_cache.cache_path(name, extension=".npz")
+    source_key = data_cache.source_key([geofile])
+
+    weights = None
+    if data_cache.is_current(name, source_key, extension=".npz"):
+        with np.load(file_name) as saved:
+            weights = sparse.csr_matrix(
+                (saved["data"], saved["indices"], saved["indptr"]),
+                shape=tuple(saved["shape"]))
+            ids = pd.Index(saved["ids"])
+        if not data[key].isin(ids).all():
+            weights = None
+
+    if weights is None:
+        base = data[data['geometry'].notna() & ~data[key].duplicated()]
+        weights = contiguity_weights(base['geometry'], kind)
+        ids = pd.Index(base[key].to_numpy())
+        os.makedirs(data_cache.CACHE_FOLDER, exist_ok=True)
+        temporary = data_cache.temporary_path()
+        with open(temporary, "wb") as handle:
+            np.savez(handle, data=weights.data, indices=weights.indices,
+                     indptr=weights.indptr, shape=weights.shape,
+                     ids=ids.to_numpy())
+        os.replace(temporary, file_name)
+        data_cache.write_keys([name], source_key)
+
+    # Takes the rows and columns of the counties in data
+    wanted = pd.Index(data[key].dropna().unique())
+    positions = ids.get_indexer(wanted)
+    positions = positions[positions >= 0]
+
+    return weights[positions][:, positions], ids[positions]
+
+
+def row_standardized(weights):
+    """
+    This function takes a sparse weights matrix and returns it
+    with every row summing to one. Counties without neighbours
+    keep a row of zeros.
+    """
+    totals = np.asarray(weights.sum(axis=1)).ravel()
+    scale = np.divide(1.0, totals, out=np.zeros_like(totals),
+                      where=totals > 0)
+
+    return sparse.diags(scale) @ weights
+
+
+def aligned_values(data, column, weights, ids, key="FIPS"):
+    """
+    This function takes the merged data, a metric column and
+    the (weights, ids) of county_weights, and returns the metric
+    of every county with a value, the row-standardized weights
+    between those counties and their ids.
+    """
+    values = data.drop_duplicates(key).set_index(key)[column]
+    values = values.reindex(ids).to_numpy(dtype=np.float64)
+    valid = ~np.isnan(values)
+
+    weights = row_standardized(weights[valid][:, valid])
+
+    return values[valid], weights, ids[valid]
+
+
+def pseudo_p_value(observed, simulated):
+    """
+    This function takes observed statistics and an array of
+    permuted statistics (one row per observed value, or one row
+    for a single value) and returns the folded pseudo p-value:
+    the share of permutations at least as extreme as the
+    observed value in the direction it lies.
+    The data itself counts as one of the permutations.
+    """
+    permutations = simulated.shape[-1]
+    larger = np.sum(simulated >= observed[..., None], axis=-1)
+    larger = np.minimum(larger, permutations - larger)
+
+    return (larger + 1) / (permutations + 1)
+
+
+def morans_i(values, weights, permutations=999, seed=None):
+    """
+    This function takes an array of values and a row-standardized
+    sparse weights matrix and returns a MoranResult with global
+    Moran's I and its permutation inference.
+    The permutations are computed in batches, each with a single
+    sparse product of the weights and a matrix of permuted values.
+    """
+    z = values - values.mean()
+    n = len(z)
+    total_weight = weights.sum()
+    scale = n / total_weight / np.dot(z, z)
+
+    statistic = scale * np.dot(z, weights @ z)
+
+    rng = np.random.default_rng(seed)
+    simulated = np.empty(permutations)
+    step = max(1, BATCH_VALUES // max(n, 1))
+    for start in range(0, permutations, step):
+        count = min(step, permutations - start)
+        permuted = rng.permuted(np.tile(z, (count, 1)), axis=1)
+        lag = (weights @ permuted.T).T
+        simulated[start:start + count] = scale * np.einsum(
+            "ij,ij->i", permuted, lag)
+
+    p_value = pseudo_p_value(np.array(statistic), simulated[None, :])[0]
+    z_score = (statistic - simulated.mean()) / simulated.std()
+
+    return MoranResult(statistic, -1 / (n - 1), p_value, z_score, n,
+                       simulated)
+
+
+def local_morans(values, weights, permutations=999, seed=None):
+    """
+    This function takes an array of values and a row-standardized
+    sparse weights matrix and returns (statistics, p_values,
+    quadrants): the local Moran's I of every county, its
+    conditional permutation pseudo p-value and its quadrant
+    (see QUADRANTS).
+    Each county's neighbours are replaced by random other counties.
+    Counties with the same number of neighbours are permuted
+    together in batches using one shared set of random draws.
+    """
+    z = values - values.mean()
+    n = len(z)
+    m2 = np.dot(z, z) / n
+    lag = weights @ z
+    statistics = z * lag / m2
+
+    # Quadrant of each county against the lag of its neighbours
+    quadrants = np.where(z > 0, np.where(lag > 0, 1, 4),
+                         np.where(lag > 0, 2, 3))
+
+    cardinality = np.diff(weights.indptr)
+    rng = np.random.default_rng(seed)
+
+    # Draws the permutations in batches and keeps only the columns
+    # used, so the full permutations x counties array is never held
+    width = min(max(cardinality.max(), 1), n - 1)
+    draws = np.empty((permutations, width), dtype=np.intp)
+    step = max(1, BATCH_VALUES // max(n, 1))
+    for start in range(0, permutations, step):
+        count = min(step, permutations - start)
+        draws[start:start + count] = rng.permuted(
+            np.tile(np.arange(n - 1), (count, 1)), axis=1)[:, :width]
+
+    p_values = np.full(n, np.nan)
+    for neighbours in np.unique(cardinality[cardinality > 0]):
+        places = np.flatnonzero(cardinality == neighbours)
+        sample = draws[:, :neighbours]
+        step = max(1, BATCH_VALUES // (permutations * neighbours))
+        for start in range(0, len(places), step):
+            batch = places[start:start + step]
+
+            # Skips the county itself among the other counties
+            index = sample[None, :, :] + \
+                (sample[None, :, :] >= batch[:, None, None])
+            simulated = z[batch, None] * z[index].mean(axis=2) / m2
+            p_values[batch] = pseudo_p_value(statistics[batch], simulated)
+
+    return statistics, p_values, quadrants
+
+
+def spatial_autocorrelation(data, column, kind="queen", permutations=999,
+                            seed=None, key="FIPS"):
+    """
+    This function takes the merged data and the name of a
+    per-county metric column and returns the global Moran's I
+    of that metric as a MoranResult. Counties without a value
+    are left out.
+    """
+    weights, ids = county_weights(data, key, kind)
+    values, weights, ids = aligned_values(data, column, weights, ids, key)
+
+    return morans_i(values, weights, permutations, seed)
+
+
+def hotspots(data, column, kind="queen", permutations=999, seed=None,
+             significance=0.05, key="FIPS"):
+    """
+    This function takes the merged data and the name of a
+    per-county metric column and returns a dataframe indexed by
+    key with the local Moran's I, pseudo p-value and cluster of
+    every county. The cluster is the quadrant name (High-High,
+    Low-High, Low-Low or High-Low) where the p-value is below
+    significance and "Not significant" elsewhere.
+    """
+    weights, ids = county_weights(data, key, kind)
+    values, weights, ids = aligned_values(data, column, weights, ids, key)
+    statistics, p_values, quadrants = local_morans(values, weights,
+                                                   permutations, seed)
+
+    clusters = pd.Series(quadrants).map(QUADRANTS).to_numpy(dtype=object)
+    clusters[~(p_values < significance)] = "Not significant"
+
+    return pd.DataFrame({column: values, "I": statistics,
+                         "p_value": p_values, "quadrant": quadrants,
+                         "cluster": clusters}, index=ids.rename(key))
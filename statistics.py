@@ -3,92 +3,139 @@ This file is responsible for the statistical
 analysis of the data.
 '''
 
-from matplotlib import pyplot as plt
+import numpy as np
 import pandas as pd
-import scipy.stats as stats
 
+from instrument import instrumented
 
-def get_statistics(data, para="Population", cases="Cases"):
+# Upper bin edges and group names used by get_statistics.
+# Density is in people per square km of equal-area land; the edges
+# are the original 30, 60, 120 and 250 divided by 2.5, the ratio of
+# the old Mercator-based density to it at the typical US latitude
+DEFAULT_BINS = {
+    "Population": ([10000, 30000, 100000, 1000000],
+                   ["Very Small", "Small", "Medium", "Large", "Very Large"]),
+    "Density": ([12, 24, 48, 100],
+                ["Very Sparse", "Sparse", "Medium", "Dense", "Very Dense"])}
+
+
+def assign_bins(values, edges=None, labels=None, quantiles=None):
     """
-    This function takes the data for population
-    and Cases/Deaths (baseed on cases parameter)
-    for studies the statistical significance of the effects
-    of population or population density depending on the
-    parameter passed, with population being the default.
-    This function prints out the results and returns None.
+    This function takes a series of values and either a list
+    of inner bin edges or a number (or list) of quantiles, and
+    returns a categorical series with the bin of every value.
+    With edges [a, b], the bins are x < a, a <= x < b and x >= b.
+    labels optionally names the bins. Missing values get no bin.
+    """
+    if quantiles is not None:
+        return pd.qcut(values, quantiles, labels=labels, duplicates="drop")
+
+    bins = [-np.inf] + list(edges) + [np.inf]
+
+    return pd.cut(values, bins, labels=labels, right=False)
+
+
+def metric_columns(data):
+    """
+    This function takes the merged dataframe and returns a
+    dataframe of the metrics summarized per bin: cases and deaths,
+    both per 100,000 people, and both per 100,000 people per
+    unit of population density.
+    """
+    population = data["POPESTIMATE2019"]
+    metrics = pd.DataFrame({"Cases": data["Cases"], "Deaths": data["Deaths"]})
+    metrics["Cases per 100k"] = data["Cases"] / population * 100000
+    metrics["Deaths per 100k"] = data["Deaths"] / population * 100000
+    metrics["Cases per 100k per density"] = \
+        metrics["Cases per 100k"] / data["Density"]
+    metrics["Deaths per 100k per density"] = \
+        metrics["Deaths per 100k"] / data["Density"]
+
+    return metrics
+
+
+def binned_statistics(metrics, bins, statistics=("count", "mean", "std",
+                                                 "median"),
+                      quantiles=(0.25, 0.75)):
+    """
+    This function takes a dataframe of metrics and a categorical
+    series with the bin of every row, and returns a dataframe with
+    one row per bin and a (metric, statistic) column for every
+    statistic and quantile of every metric.
+    The rows are grouped once and no row data is copied.
+    """
+    grouped = metrics.groupby(bins, observed=False)
+    table = grouped.agg(list(statistics))
+
+    # Adds the quantiles from the same grouping
+    for quantile in quantiles:
+        values = grouped.quantile(quantile)
+        for metric in metrics.columns:
+            table[(metric, "q" + str(quantile))] = values[metric]
+
+    return table[list(metrics.columns)]
+
+
+def grouped_metrics(data, para="Population", bins=None, labels=None,
+                    quantiles=None):
+    """
+    This function takes the merged data and the para, bins,
+    labels and quantiles options of get_statistics and returns
+    (parameter, groups, metrics): the population or population
+    density of every county, its group and the dataframe of
+    metric_columns.
     """
     # Checks whether the data is for population or
     # population density
     if para == "Population":
-        data["Pop_Parameter"] = data["POPESTIMATE2019"]
+        parameter = data["POPESTIMATE2019"]
     elif para == "Density":
-        data['area'] = data['geometry'] \
-                      .to_crs({'init': 'epsg:3395'}) \
-                      .map(lambda p: p.area / (4*10**6))
-        data["Pop_Parameter"] = data["POPESTIMATE2019"] / data['area']
+        parameter = data["Density"]
 
-    # Gets the normalized data
-    if cases == "Cases":
-        data['Norm_Cases'] = data["Cases"] / data["POPESTIMATE2019"] * 100000
-    elif cases == "Deaths":
-        data['Norm_Cases'] = data["Deaths"] / data["POPESTIMATE2019"] * 100000
-
-    # Groups the data into sections
-    # Makes masks for use in grouping data
-    pd.options.mode.chained_assignment = None
-    if para == "Population":
-        mask1 = data["Pop_Parameter"] < 10000
-        mask2 = data["Pop_Parameter"] < 30000
-        mask3 = data["Pop_Parameter"] < 100000
-        mask4 = data["Pop_Parameter"] < 1000000
-
-    elif para == "Density":
-        mask1 = data["Pop_Parameter"] < 30
-        mask2 = data["Pop_Parameter"] < 60
-        mask3 = data["Pop_Parameter"] < 120
-        mask4 = data["Pop_Parameter"] < 250
-
-    # Group 1 x < 10k
-    group1 = data[mask1]
+    # Groups the data into sections in one pass
+    if bins is None and quantiles is None:
+        bins, labels = DEFAULT_BINS[para]
+    elif isinstance(quantiles, int) and labels is None:
+        labels = ["Q" + str(number + 1) for number in range(quantiles)]
+    groups = assign_bins(parameter, bins, labels, quantiles)
 
-    # Group 2 10k < x < 30k
-    group2 = data[~mask1 & mask2]
+    return parameter, groups, metric_columns(data)
 
-    # Group 3 30k < x < 100k
-    group3 = data[~mask2 & mask3]
 
-    # Group 4 100k < x < 1M
-    group4 = data[~mask3 & mask4]
+@instrumented
+def get_statistics(data, para="Population", cases="Cases", bins=None,
+                   labels=None, quantiles=None,
+                   folder="Project datasets/Statistics/"):
+    """
+    This function takes the data for population
+    and Cases/Deaths (baseed on cases parameter)
+    for studies the statistical significance of the effects
+    of population or population density depending on the
+    parameter passed, with population being the default.
+    bins and labels override the default bin edges and group
+    names, or quantiles splits the counties into quantile bins.
+    The boxplots are saved in folder.
+    This function prints out the p-value and returns a dataframe
+    of statistics for every metric in each group.
+    """
+    # Imported here so only plotting loads matplotlib and scipy
+    from matplotlib import pyplot as plt
+    import scipy.stats as stats
 
-    # Group 5 x > 1M
-    group5 = data[~mask4]
+    parameter, groups, metrics = grouped_metrics(data, para, bins, labels,
+                                                 quantiles)
+    table = binned_statistics(metrics, groups)
 
-    # Variables for analysis
-    groups = [group1, group2, group3, group4, group5]
-    mean = list()
-    std = list()
-    for group in groups:
-        mean.append(group["Norm_Cases"].mean())
-        std.append(group["Norm_Cases"].std())
+    # Gets the normalized data
+    norm_cases = metrics[cases + " per 100k"]
 
     # Making boxplots to visualize data
-    if para == "Population":
-        group1["Data"] = "Very Small"
-        group2["Data"] = "Small"
-        group3["Data"] = "Medium"
-        group4["Data"] = "Large"
-        group5["Data"] = "Very Large"
-    else:
-        group1["Data"] = "Very Sparse"
-        group2["Data"] = "Sparse"
-        group3["Data"] = "Medium"
-        group4["Data"] = "Dense"
-        group5["Data"] = "Very Dense"
-
-    # Plotting plot
-    cd = pd.concat(groups)
+    names = list(groups.cat.categories)
+    values = [group.dropna().to_numpy() for name, group
+              in norm_cases.groupby(groups, observed=False)]
     plt.figure()
-    cd.boxplot(by="Data", column=["Norm_Cases"])
+    plt.boxplot(values)
+    plt.xticks(range(1, len(names) + 1), names)
 
     # Plot settings
     if para == "Population":
@@ -96,26 +143,46 @@ def get_statistics(data, para="Population", cases="Cases"):
     elif para == "Density":
         temp = "Population Density"
 
-    plt.suptitle('')
     plt.title(cases + " grouped by county " + temp)
     plt.ylabel(str(cases) + " Per 100,000 population")
     plt.xlabel("County Type")
     plt.tight_layout()
 
-    plt.savefig("Project datasets/Statistics/groups-distribution.png")
+    plt.savefig(folder + "groups-distribution.png")
 
     # Setting a size limit to make a better plot
-    height = data["Norm_Cases"].mean() + 3 * data["Norm_Cases"].std()
+    height = norm_cases.mean() + 3 * norm_cases.std()
     plt.ylim(0, height)
 
-    plt.savefig("Project datasets/Statistics/groups-distribution2.png")
+    plt.savefig(folder + "groups-distribution2.png")
 
     plt.close()
 
     # What worked
-    data_clean = data.dropna(subset=["Pop_Parameter", "Norm_Cases"])
-    s, p = stats.pearsonr(data_clean["Pop_Parameter"],
-                          data_clean["Norm_Cases"])
+    valid = parameter.notna() & norm_cases.notna()
+    s, p = stats.pearsonr(parameter[valid], norm_cases[valid])
     print("p-value = " + str(p))
 
-    return None
\ No newline at end of file
+    return table
+
+
+def correlation_significance(data, para="Density", cases="Cases",
+                             method="spearman", **kwargs):
+    """
+    This function takes the merged data and tests the correlation
+    of population or population density (para) with Cases/Deaths
+    per 100,000 people (cases) by bootstrap and permutation
+    resampling. method is pearson, spearman or kendall, and any
+    other keyword is passed on to resampling.correlation_test.
+    Returns a resampling.ResamplingResult.
+    """
+    from resampling import correlation_test
+
+    if para == "Population":
+        parameter = data["POPESTIMATE2019"]
+    elif para == "Density":
+        parameter = data["Density"]
+
+    norm_cases = data[cases] / data["POPESTIMATE2019"] * 100000
+
+    return correlation_test(parameter, norm_cases, method=method, **kwargs)
@@ -0,0 +1,55 @@
+'''
+Tests of the analytics metrics on data shorter than their windows.
+Run from the project folder with
+python -m pytest test_analytics.py
+'''
+
+import numpy as np
+import pandas as pd
+
+from analytics import METRICS
+from analytics import compute_analytics
+from analytics import rolling_average
+from metric_cube import MetricCube
+from timeseries_store import TimeSeriesStore
+
+
+def short_store(days):
+    """
+    This function returns a store of two counties in one
+    state with the given number of days of growing counts.
+    """
+    metadata = pd.DataFrame({"FIPS": [1001, 1003],
+                             "Province_State": ["Alabama", "Alabama"],
+                             "Admin2": ["Autauga", "Baldwin"],
+                             "Population": [55869.0, 223234.0]})
+    dates = pd.date_range("2020-03-01", periods=days)
+    cases = np.cumsum(np.ones((2, days)), axis=1)
+
+    return TimeSeriesStore(metadata, dates, cases, cases / 10)
+
+
+def test_rolling_average_shorter_than_window():
+    new = np.ones((1, 5))
+    assert np.isnan(rolling_average(new, 7)).all()
+    assert rolling_average(new, 5)[0, -1] == 1
+
+
+def test_compute_analytics_short_store():
+    for days in [1, 6, 13]:
+        analytics = compute_analytics(short_store(days))
+        for level in ["county", "state"]:
+            for kind in ["Cases", "Deaths"]:
+                for metric in METRICS:
+                    values = analytics[level][kind][metric]
+                    assert values.shape[1] == days
+                assert np.isnan(analytics[level][kind]["avg14"]).all()
+
+
+def test_metric_cube_short_store(tmp_path, monkeypatch):
+    # Keeps the analytics cache out of the project folder
+    monkeypatch.chdir(tmp_path)
+    store = short_store(3)
+    cube = MetricCube.from_store(store)
+    assert cube.values.shape[1] == 3
+    assert cube.lookup("Alabama")["Cases"].iloc[-1] == 6
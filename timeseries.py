@@ -5,7 +5,18 @@ Only the function state_timeseries
 needs to be imported to get the graphs.
 '''
 
-from matplotlib import pyplot as plt
+import pandas as pd
+
+from analytics import daily_new
+from analytics import get_analytics
+from analytics import rolling_average
+from instrument import instrumented
+from metric_cube import MetricCube
+import render_cache
+
+from timeseries_archive import TimeSeriesArchive
+from timeseries_store import TimeSeriesStore
+from timeseries_store import date_columns
 
 
 def get_county_data(data, county, state):
@@ -30,10 +41,11 @@ def get_state_data(data, state):
     temp = data[mask].reset_index()
 
     # Groups the data by their sum
-    temp2 = temp.groupby(["Province_State"]).sum()
+    temp2 = temp.groupby(["Province_State"], observed=True) \
+        .sum(numeric_only=True)
 
     # Turns the dataframe into a series
-    data_row = temp2.iloc[0].copy(deep=True)
+    data_row = temp2.iloc[0].astype(object)
 
     # Saves the State name for later use
     data_row.loc["UID"] = state
@@ -41,24 +53,52 @@ def get_state_data(data, state):
     return data_row
 
 
-def graph_cum_timeseries(data, kind, place):
+def graph_cum_timeseries(data, kind, place, name=None, file_name=None,
+                         use_cache=True):
     """
     This function takes a data series
     and kind of case (Normalized/Raw Cases/Deaths)
     and place type (either County or State)
     and graphs the cumulative number of cases/deaths.
-    Returns None
+    If name is given, data is a series of values indexed
+    by date and name is the county or state name.
+    Returns True if the plot was drawn and False if it was
+    taken from render_cache.
     The prints are saved under the name
-    "Cumulative_kind_in_County/State name.png"
+    "Cumulative_kind_in_County/State name.png", or in file_name
+    if given, which may also be a file object such as io.BytesIO.
+    If use_cache = True, a plot already drawn from the same data
+    is taken from render_cache instead of being drawn again.
     """
     # Sets up parameters
-    time_data = data[12:]
+    if name is None:
+        time_data = data[date_columns(data)].astype(float)
+        if place == "County":
+            name = data["Admin2"]
+        else:
+            name = data["UID"]
+    else:
+        time_data = data
 
     # Adds county to the name
     if place == "County":
-        name = data["Admin2"] + "_County"
-    else:
-        name = data["UID"]
+        name = name + "_County"
+
+    if file_name is None:
+        file_name = ("Project datasets/Timeseries/Cumulative_" +
+                     kind + "_in_" + name + ".png")
+
+    # Skips drawing when the same plot is cached
+    key = None
+    if use_cache and isinstance(file_name, str):
+        key = render_cache.render_key(
+            "graph_cum_timeseries", kind=kind, place=place, name=name,
+            data=render_cache.data_version(time_data))
+        if render_cache.fetch(key, [file_name]):
+            return False
+
+    # Imported here so only plotting loads matplotlib
+    from matplotlib import pyplot as plt
 
     time_data.plot()
 
@@ -69,33 +109,73 @@ def graph_cum_timeseries(data, kind, place):
     plt.tight_layout()
 
     # Saving the plot
-    plt.savefig("Project datasets/Timeseries/Cumulative_" +
-                kind + "_in_" + name + ".png")
+    plt.savefig(file_name, format="png")
     plt.close()
 
+    if key is not None:
+        render_cache.store(key, [file_name])
+
+    return True
 
-def graph_diff_timeseries(data, kind, place):
+
+def graph_diff_timeseries(data, kind, place, name=None, daily=None,
+                          average=None, file_name=None, use_cache=True):
     """
     This function takes a data series
     and a string with the kind of case
     (Normalized/Raw Cases/Deaths)
     and a string with the place type (either County or State)
     and graphs the number of cases/deaths for each day.
-    Returns None
+    If name is given, data is a series of values indexed
+    by date and name is the county or state name.
+    daily optionally gives the precomputed daily numbers and
+    average a rolling average to draw over them.
+    Returns True if the plot was drawn and False if it was
+    taken from render_cache.
     The prints are saved under the name
-    "New_kind_in_County/State name.png"
+    "New_kind_in_County/State name.png", or in file_name
+    if given, which may also be a file object such as io.BytesIO.
+    If use_cache = True, a plot already drawn from the same data
+    is taken from render_cache instead of being drawn again.
     """
     # Sets up parameters
-    time_data = data[12:]
-    difference = time_data.diff()
+    if name is None:
+        time_data = data[date_columns(data)].astype(float)
+        if place == "County":
+            name = data["Admin2"]
+        else:
+            name = data["UID"]
+    else:
+        time_data = data
+    if daily is None:
+        difference = time_data.diff()
+    else:
+        difference = daily
 
     # Adds county to the name
     if place == "County":
-        name = data["Admin2"] + " County"
-    else:
-        name = data["UID"]
+        name = name + " County"
+
+    if file_name is None:
+        file_name = ("Project datasets/Timeseries/New_" +
+                     kind + "_in_" + name + ".png")
+
+    # Skips drawing when the same plot is cached
+    key = None
+    if use_cache and isinstance(file_name, str):
+        key = render_cache.render_key(
+            "graph_diff_timeseries", kind=kind, place=place, name=name,
+            data=render_cache.data_version(difference, average))
+        if render_cache.fetch(key, [file_name]):
+            return False
+
+    # Imported here so only plotting loads matplotlib
+    from matplotlib import pyplot as plt
 
     difference.plot()
+    if average is not None:
+        average.plot(label="7-day average")
+        plt.legend()
 
     # Plot settings
     plt.title("Daily " + kind + " in " + name)
@@ -104,18 +184,29 @@ def graph_diff_timeseries(data, kind, place):
     plt.tight_layout()
 
     # Saving the plot
-    plt.savefig("Project datasets/Timeseries/New_" +
-                kind + "_in_" + name + ".png")
+    plt.savefig(file_name, format="png")
     plt.close()
 
+    if key is not None:
+        render_cache.store(key, [file_name])
 
+    return True
+
+
+@instrumented
 def county_timeseries(data, kind, county, state):
     """
     This function takes in the cases or deaths
     data, and the county name and state
     and prints a timeserises graph.
+    data can also be a TimeSeriesStore, TimeSeriesArchive
+    or MetricCube holding both.
     Returns none.
     """
+    if isinstance(data, (TimeSeriesStore, TimeSeriesArchive, MetricCube)):
+        store_county_timeseries(data, kind, county, state)
+        return
+
     # Gets the relevant row
     data_row = get_county_data(data, county, state)
 
@@ -126,20 +217,107 @@ def county_timeseries(data, kind, county, state):
     # Normalizes the data
     nor_kind = "Normalized " + kind
     nor_data = data_row.copy(deep=True)
-    nor_data[12:] = nor_data[12:] / nor_data["Population"]
+    dates = date_columns(nor_data)
+    nor_data[dates] = nor_data[dates] / nor_data["Population"]
 
     # Gets Normalized time data
     graph_cum_timeseries(nor_data, nor_kind, "County")
 
 
+def precomputed_daily(store, level, kind, row, analytics=None):
+    """
+    This function takes a TimeSeriesStore, the level (county or
+    state), the kind of data and a row, and returns the daily
+    numbers and their 7-day average from analytics.get_analytics
+    as series indexed by date.
+    analytics can give the result of get_analytics, fetched once
+    for many plots.
+    """
+    if analytics is None:
+        analytics = get_analytics(store)
+    metrics = analytics[level][kind]
+    daily = pd.Series(metrics["new"][row], index=store.dates)
+    average = pd.Series(metrics["avg7"][row], index=store.dates)
+
+    return daily, average
+
+
+def series_daily(time_data):
+    """
+    This function takes one cumulative series indexed by date
+    and returns its daily numbers and their 7-day average,
+    computed the same way as analytics.get_analytics.
+    """
+    new = daily_new(time_data.to_numpy(dtype=float)[None, :])
+    daily = pd.Series(new[0], index=time_data.index)
+    average = pd.Series(rolling_average(new, 7)[0], index=time_data.index)
+
+    return daily, average
+
+
+def place_daily(store, level, kind, row, time_data, analytics=None):
+    """
+    This function returns the daily numbers and 7-day average
+    of one place, precomputed for a whole TimeSeriesStore or
+    MetricCube, or computed from time_data alone for a
+    TimeSeriesArchive, so the archive is never read beyond
+    that place. analytics is passed on to precomputed_daily.
+    """
+    if isinstance(store, MetricCube):
+        return (store.series(kind + " new", row),
+                store.series(kind + " avg7", row))
+    elif isinstance(store, TimeSeriesArchive):
+        return series_daily(time_data)
+
+    return precomputed_daily(store, level, kind, row, analytics)
+
+
+def store_county_timeseries(store, kind, county, state, analytics=None):
+    """
+    This function takes a TimeSeriesStore, TimeSeriesArchive or
+    MetricCube, the kind of data (Cases or Deaths) and the
+    county name and state and prints a timeserises graph.
+    analytics optionally gives the result of get_analytics.
+    Returns the number of plots drawn, leaving out the plots
+    taken from render_cache.
+    """
+    # Gets a view of the county's row
+    time_data = store.county_series(kind, county, state)
+    row = store.row(county, state)
+    daily, average = place_daily(store, "county", kind, row, time_data,
+                                 analytics)
+
+    # Gets time data
+    drawn = graph_cum_timeseries(time_data, kind, "County", county)
+    drawn += graph_diff_timeseries(time_data, kind, "County", county, daily,
+                                   average)
+
+    # Normalizes the data
+    nor_kind = "Normalized " + kind
+    population = store.population[store.row(county, state)]
+    nor_data = time_data / population
+
+    # Gets Normalized time data
+    drawn += graph_cum_timeseries(nor_data, nor_kind, "County", county)
+
+    return drawn
+
+
+@instrumented
 def state_timeseries(data, kind, state):
     """
     This function takes in the cases or deaths
     data, a string with the type of data
     (Cases or Deaths) and the state name
     and prints a timeserises graph.
+    data can also be a TimeSeriesStore, TimeSeriesArchive
+    or MetricCube holding both.
     Returns none.
     """
+    if isinstance(data, (TimeSeriesStore, TimeSeriesArchive, MetricCube)):
+        store_state_timeseries(data, kind, state)
+        return
+
     # Gets the relevant row
     data_row = get_state_data(data, state)
 
@@ -150,7 +328,39 @@ def state_timeseries(data, kind, state):
     # Normalizes the data
     nor_kind = "Normalized " + kind
     nor_data = data_row.copy(deep=True)
-    nor_data[12:] = nor_data[12:] / nor_data["Population"] * 100000
+    dates = date_columns(nor_data)
+    nor_data[dates] = nor_data[dates] / nor_data["Population"] * 100000
+
+    # Gets Normalized time data
+    graph_cum_timeseries(nor_data, nor_kind, "State")
+
+
+def store_state_timeseries(store, kind, state, analytics=None):
+    """
+    This function takes a TimeSeriesStore, TimeSeriesArchive or
+    MetricCube, the kind of data (Cases or Deaths) and the
+    state name and prints a timeserises graph.
+    analytics optionally gives the result of get_analytics.
+    Returns the number of plots drawn, leaving out the plots
+    taken from render_cache.
+    """
+    # Gets a view of the precomputed state totals
+    time_data = store.state_series(kind, state)
+    row = store.state_rows[state]
+    daily, average = place_daily(store, "state", kind, row, time_data,
+                                 analytics)
+
+    # Gets time data
+    drawn = graph_cum_timeseries(time_data, kind, "State", state)
+    drawn += graph_diff_timeseries(time_data, kind, "State", state, daily,
+                                   average)
+
+    # Normalizes the data
+    nor_kind = "Normalized " + kind
+    population = store.state_population[store.state_rows[state]]
+    nor_data = time_data / population * 100000
 
     # Gets Normalized time data
-    graph_cum_timeseries(nor_data, nor_kind, "State")
\ No newline at end of file
+    drawn += graph_cum_timeseries(nor_data, nor_kind, "State", state)
+
+    return drawn
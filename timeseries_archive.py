@@ -0,0 +1,241 @@
+'''
+This file is responsible for keeping the cases and deaths
+history on disk as one memory-mapped array, so the time series
+of a county or state can be read without loading the CSV files.
+The archive is a folder holding values.npy, a float64 array of
+regions x days x metrics, and regions.json with the dates, the
+metric names and the FIPS, Admin2, Province_State and Population
+of every region. Counties come first, followed by one row of
+totals per state.
+Opening the archive only reads regions.json; the values of a
+region and date range are read from disk when they are asked for.
+'''
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+
+ARCHIVE_FOLDER = data_cache.CACHE_FOLDER + "Archive/"
+
+# Metrics along the last axis of the array
+METRICS = ("Cases", "Deaths")
+
+# Days of room added whenever the array grows, so that
+# daily updates are written in place
+GROWTH_DAYS = 366
+
+
+class TimeSeriesArchive:
+    """
+    This class opens the archive in folder, read-only unless
+    mode is "r+". values is the memory-mapped array, dates a
+    DatetimeIndex of the stored days and metadata a dataframe
+    with one row per region. It can be used in place of a
+    TimeSeriesStore by county_timeseries and state_timeseries.
+    """
+
+    def __init__(self, folder=ARCHIVE_FOLDER, mode="r"):
+        self.folder = folder
+        with open(folder + "regions.json") as handle:
+            sidecar = json.load(handle)
+
+        self.metrics = sidecar["metrics"]
+        self.dates = pd.DatetimeIndex(sidecar["dates"])
+        self.counties = sidecar["counties"]
+        self.regions = sidecar["regions"]
+        self.metadata = pd.DataFrame(self.regions)
+        self.population = self.metadata["Population"] \
+            .to_numpy(dtype=np.float64)
+        self.values = np.load(folder + "values.npy", mmap_mode=mode)
+
+        # Hash maps from names to region rows
+        keys = zip(self.metadata["Province_State"][:self.counties],
+                   self.metadata["Admin2"][:self.counties])
+        self.rows = dict()
+        for row, key in enumerate(keys):
+            self.rows.setdefault(key, row)
+        self.state_rows = dict(
+            (state, row) for row, state in enumerate(
+                self.metadata["Province_State"][self.counties:],
+                self.counties))
+
+        # State rows share the region axis with the counties
+        self.state_population = self.population
+
+    @classmethod
+    def write(cls, store, folder=ARCHIVE_FOLDER, extra_days=GROWTH_DAYS):
+        """
+        This function takes a TimeSeriesStore and writes it as
+        a new archive in folder, with room for extra_days more
+        days. Returns the archive opened for reading.
+        """
+        os.makedirs(folder, exist_ok=True)
+        counties = len(store.metadata)
+        states = len(store.states)
+        shape = (counties + states, len(store.dates) + extra_days,
+                 len(METRICS))
+
+        # Writes to a temporary file so readers never see half of it
+        temporary = folder + "values.tmp.npy"
+        values = np.lib.format.open_memmap(temporary, mode="w+",
+                                           dtype=np.float64, shape=shape)
+        values[:] = np.nan
+        days = len(store.dates)
+        values[:counties, :days, 0] = store.cases
+        values[:counties, :days, 1] = store.deaths
+        values[counties:, :days, 0] = store.state_cases
+        values[counties:, :days, 1] = store.state_deaths
+        values.flush()
+        del values
+        os.replace(temporary, folder + "values.npy")
+
+        fips = pd.to_numeric(store.metadata["FIPS"], errors="coerce") \
+            .astype(np.float64)
+        regions = {
+            "FIPS": [None if value != value else int(value)
+                     for value in fips] + [None] * states,
+            "Admin2": list(store.metadata["Admin2"]) + [None] * states,
+            "Province_State": list(store.metadata["Province_State"]) +
+            list(store.states),
+            "Population": [None if value != value else float(value)
+                           for value in np.r_[store.population,
+                                              store.state_population]]}
+        write_sidecar(folder, store.dates, counties, regions)
+
+        return cls(folder)
+
+    @classmethod
+    def update(cls, store, folder=ARCHIVE_FOLDER):
+        """
+        This function takes a TimeSeriesStore and brings the
+        archive in folder up to date with it. If the archive
+        holds the same counties and its dates begin the store's
+        dates, only the new days are written, in place while
+        there is room. Otherwise the archive is rewritten.
+        Returns the archive opened for reading.
+        """
+        try:
+            archive = cls(folder, mode="r+")
+        except FileNotFoundError:
+            return cls.write(store, folder)
+
+        days = len(archive.dates)
+        matches = (archive.counties == len(store.metadata) and
+                   len(archive.state_rows) == len(store.states) and
+                   store.dates[:days].equals(archive.dates) and
+                   list(archive.metadata["Admin2"][:archive.counties]) ==
+                   list(store.metadata["Admin2"]))
+        if not matches or len(store.dates) > archive.values.shape[1]:
+            del archive
+            return cls.write(store, folder)
+
+        if len(store.dates) == days:
+            return cls(folder)
+
+        # Writes the values before the dates that make them visible
+        counties = archive.counties
+        values = archive.values
+        values[:counties, days:len(store.dates), 0] = store.cases[:, days:]
+        values[:counties, days:len(store.dates), 1] = store.deaths[:, days:]
+        values[counties:, days:len(store.dates), 0] = \
+            store.state_cases[:, days:]
+        values[counties:, days:len(store.dates), 1] = \
+            store.state_deaths[:, days:]
+        values.flush()
+
+        write_sidecar(folder, store.dates, counties, archive.regions)
+        del archive, values
+
+        return cls(folder)
+
+    def row(self, county, state):
+        """
+        This function takes a county and state name and
+        returns the region row of that county.
+        """
+        try:
+            return self.rows[(state, county)]
+        except KeyError:
+            raise KeyError(county + ", " + state + " is not in the data")
+
+    def date_range(self, start=None, end=None):
+        """
+        This function takes the first and last date to read,
+        either of which may be None for no limit, and returns
+        the matching slice of the day axis.
+        """
+        return self.dates.slice_indexer(start, end)
+
+    def read(self, kind, rows=slice(None), start=None, end=None):
+        """
+        This function takes "Cases" or "Deaths", a row, list
+        of rows or slice of regions and a date range and returns
+        an array of only those values, read from disk.
+        """
+        try:
+            metric = self.metrics.index(kind)
+        except ValueError:
+            raise KeyError(kind)
+        days = self.date_range(start, end)
+
+        # Unused days past the last date are never read
+        days = slice(*days.indices(len(self.dates)))
+
+        return np.array(self.values[rows, days, metric])
+
+    def series(self, kind, row, start=None, end=None):
+        """
+        This function takes "Cases" or "Deaths", a region row
+        and a date range and returns that region's series.
+        """
+        return pd.Series(self.read(kind, row, start, end),
+                         index=self.dates[self.date_range(start, end)])
+
+    def county_series(self, kind, county, state, start=None, end=None):
+        """
+        This function takes "Cases" or "Deaths", a county, a
+        state and an optional date range and returns the
+        county's series indexed by date.
+        """
+        return self.series(kind, self.row(county, state), start, end)
+
+    def state_series(self, kind, state, start=None, end=None):
+        """
+        This function takes "Cases" or "Deaths", a state and an
+        optional date range and returns the state's summed
+        series indexed by date.
+        """
+        try:
+            row = self.state_rows[state]
+        except KeyError:
+            raise KeyError(state + " is not in the data")
+
+        return self.series(kind, row, start, end)
+
+
+def write_sidecar(folder, dates, counties, regions):
+    """
+    This function writes regions.json of an archive with its
+    dates, the number of county rows and the region columns.
+    """
+    sidecar = {"metrics": list(METRICS),
+               "dates": [str(date.date()) for date in dates],
+               "counties": counties, "regions": regions}
+
+    temporary = folder + "regions.tmp.json"
+    with open(temporary, "w") as handle:
+        json.dump(sidecar, handle)
+    os.replace(temporary, folder + "regions.json")
+
+
+if __name__ == "__main__":
+    # Builds or updates the archive from the source files
+    from data_imports import get_incremental
+    merged_data, store = get_incremental()
+    archive = TimeSeriesArchive()
+    print("Archive holds " + str(len(archive.metadata)) + " regions and " +
+          str(len(archive.dates)) + " days")
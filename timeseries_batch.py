@@ -0,0 +1,118 @@
+'''
+This file is responsible for rendering the timeseries
+plots of many counties and states at once.
+The data is loaded once and the plots are rendered
+in parallel by a pool of worker processes.
+'''
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from analytics import get_analytics
+from timeseries import store_county_timeseries
+from timeseries import store_state_timeseries
+
+# Cumulative, daily and normalized cumulative plots of each task
+PLOTS_PER_TASK = 3
+
+# The store and analytics of the current worker process
+worker_store = None
+worker_analytics = None
+
+
+def init_worker(store, analytics):
+    """
+    This function runs once in every worker process.
+    It keeps the store and its analytics for the tasks of that
+    worker and switches matplotlib to the non-interactive Agg
+    backend.
+    """
+    global worker_store, worker_analytics
+    worker_store = store
+    worker_analytics = analytics
+
+    from matplotlib import pyplot as plt
+    plt.switch_backend("Agg")
+
+
+def render_place(task):
+    """
+    This function takes a (place, kind) task and renders
+    the timeseries plots of that place with the worker's store.
+    place is a state name or a (county, state) tuple.
+    Returns the number of plots drawn, leaving out the plots
+    taken from render_cache.
+    """
+    place, kind = task
+    if isinstance(place, tuple):
+        county, state = place
+        return store_county_timeseries(worker_store, kind, county, state,
+                                       worker_analytics)
+
+    return store_state_timeseries(worker_store, kind, place,
+                                  worker_analytics)
+
+
+def state_counties(store, state):
+    """
+    This function takes a TimeSeriesStore and a state name
+    and returns a list of (county, state) places for every
+    county in that state.
+    """
+    return [(county, state) for (place_state, county) in store.rows
+            if place_state == state]
+
+
+def render_timeseries_batch(places, kinds=("Cases", "Deaths"), workers=None,
+                            store=None):
+    """
+    This function takes a list of places (state names or
+    (county, state) tuples) and a list of kinds (Cases/Deaths)
+    and renders the timeseries plots for every combination.
+    The data is loaded once, or taken from store if given,
+    and handed to each worker process once rather than per task.
+    workers is the number of processes, defaulting to the
+    number of CPUs. workers = 1 renders in this process.
+    Prints the throughput and returns a dictionary with the
+    number of plots drawn, the number taken from render_cache,
+    the seconds taken and plots drawn per second.
+    """
+    if store is None:
+        from data_imports import get_merged
+        from timeseries_store import TimeSeriesStore
+
+        merged_data, casesdataset, deathsdataset = get_merged()
+        store = TimeSeriesStore.from_frames(casesdataset, deathsdataset)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    tasks = [(place, kind) for place in places for kind in kinds]
+
+    # Computed and saved once here rather than by every worker
+    analytics = get_analytics(store)
+
+    start = time.perf_counter()
+    if workers == 1:
+        init_worker(store, analytics)
+        plots = sum(render_place(task) for task in tasks)
+    else:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_worker,
+                                 initargs=(store, analytics)) as executor:
+            plots = sum(executor.map(render_place, tasks,
+                                     chunksize=chunksize))
+    seconds = time.perf_counter() - start
+
+    # The plots that were not drawn came from the render cache
+    cached = PLOTS_PER_TASK * len(tasks) - plots
+
+    rate = plots / seconds if seconds > 0 else float("inf")
+    print("Rendered " + str(plots) + " plots and took " + str(cached) +
+          " from the render cache in " + str(round(seconds, 2)) +
+          " seconds (" + str(round(rate, 1)) + " plots/second rendered)")
+
+    return {"plots": plots, "cached": cached, "seconds": seconds,
+            "plots_per_second": rate}
@@ -0,0 +1,307 @@
+'''
+This file is responsible for holding the cases and deaths
+time series as dense counties x days arrays.
+A county's series can then be looked up by name without
+scanning the whole cases or deaths dataframe.
+'''
+
+import datetime
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+
+
+def parse_date(name):
+    """
+    This function takes a column name and returns it as a
+    datetime.date if it is a date like '6/2/2020' or '6/2/20'.
+    Returns None for any other column name.
+    """
+    parts = str(name).split("/")
+    if len(parts) != 3 or not all(part.isdigit() for part in parts):
+        return None
+
+    month, day, year = [int(part) for part in parts]
+    if year < 100:
+        year = year + 2000
+
+    try:
+        return datetime.date(year, month, day)
+    except ValueError:
+        return None
+
+
+def date_columns(data):
+    """
+    This function takes the cases or deaths dataframe,
+    or one row of it as a series, and returns a list of
+    its date columns in file order.
+    """
+    if isinstance(data, pd.Series):
+        names = data.index
+    else:
+        names = data.columns
+
+    return [column for column in names if parse_date(column) is not None]
+
+
+def newest_date_column(data):
+    """
+    This function takes the cases or deaths dataframe
+    and returns the name of its most recent date column.
+    """
+    return max(date_columns(data), key=parse_date)
+
+
+class TimeSeriesStore:
+    """
+    This class holds the cases and deaths data as two
+    C-contiguous float64 arrays of shape (counties, days),
+    a DatetimeIndex of the days, a metadata dataframe with
+    one row per county, and a dictionary mapping
+    (state, county) to the row of that county.
+    Rows are sorted by state so that the state totals can
+    be summed in one segmented reduction.
+    """
+
+    def __init__(self, metadata, dates, cases, deaths):
+        # Sorts the counties so each state is one block of rows
+        order = np.argsort(metadata["Province_State"].to_numpy(),
+                           kind="stable")
+        self.metadata = metadata.iloc[order].reset_index(drop=True)
+        self.dates = dates
+        self.cases = np.ascontiguousarray(np.asarray(cases)[order],
+                                          dtype=np.float64)
+        self.deaths = np.ascontiguousarray(np.asarray(deaths)[order],
+                                           dtype=np.float64)
+        self.population = self.metadata["Population"] \
+            .to_numpy(dtype=np.float64)
+
+        # Hash map from (state, county) to row
+        keys = zip(self.metadata["Province_State"], self.metadata["Admin2"])
+        self.rows = dict()
+        for row, key in enumerate(keys):
+            self.rows.setdefault(key, row)
+
+        # Hash of the data, computed on the first call of version
+        self.cached_version = None
+
+        self.aggregate_states()
+
+    def aggregate_states(self):
+        """
+        This function sums the cases, deaths and population
+        of every state's counties into (states, days) arrays.
+        Missing values count as zero, as in a groupby sum.
+        """
+        states = self.metadata["Province_State"].to_numpy()
+        starts = np.flatnonzero(np.r_[True, states[1:] != states[:-1]])
+
+        self.state_starts = starts
+        self.states = states[starts]
+        self.state_rows = dict((state, row) for row, state
+                               in enumerate(self.states))
+        self.state_cases = np.add.reduceat(np.nan_to_num(self.cases),
+                                           starts, axis=0)
+        self.state_deaths = np.add.reduceat(np.nan_to_num(self.deaths),
+                                            starts, axis=0)
+        self.state_population = np.add.reduceat(
+            np.nan_to_num(self.population), starts)
+
+    @classmethod
+    def from_frames(cls, cases_data, deaths_data):
+        """
+        This function takes the cases and deaths dataframes
+        from data_imports.get_cases and returns a store.
+        The deaths rows are aligned to the cases rows by
+        state and county name.
+        """
+        keys = ["Province_State", "Admin2"]
+        metadata = cases_data[["FIPS"] + keys].reset_index(drop=True)
+
+        # Population is only in the deaths file in the JHU data
+        if "Population" in cases_data.columns:
+            metadata["Population"] = cases_data["Population"].to_numpy()
+        else:
+            population = deaths_data.set_index(keys)["Population"]
+            population = population[~population.index.duplicated()]
+            metadata["Population"] = population.reindex(
+                pd.MultiIndex.from_frame(metadata[keys])).to_numpy()
+
+        case_dates = date_columns(cases_data)
+        death_dates = date_columns(deaths_data)
+        dates = pd.DatetimeIndex([parse_date(name) for name in case_dates])
+
+        cases = cases_data[case_dates].to_numpy(dtype=np.float64)
+
+        # Lines the deaths up with the cases rows and dates
+        deaths_frame = deaths_data.set_index(keys)[death_dates]
+        deaths_frame = deaths_frame[~deaths_frame.index.duplicated()]
+        deaths_frame.columns = pd.DatetimeIndex(
+            [parse_date(name) for name in death_dates])
+        deaths = deaths_frame.reindex(
+            index=pd.MultiIndex.from_frame(metadata[keys]),
+            columns=dates).to_numpy(dtype=np.float64)
+
+        return cls(metadata, dates, cases, deaths)
+
+    @classmethod
+    def load(cls, file_name):
+        """
+        This function takes the name of a file written by
+        save and returns the store held in it.
+        """
+        with np.load(file_name) as saved:
+            metadata = pd.DataFrame({
+                "FIPS": saved["fips"],
+                "Province_State": saved["states"].astype(object),
+                "Admin2": saved["counties"].astype(object),
+                "Population": saved["population"]})
+            dates = pd.DatetimeIndex(saved["dates"])
+            cases = saved["cases"]
+            deaths = saved["deaths"]
+
+        return cls(metadata, dates, cases, deaths)
+
+    def save(self, file_name):
+        """
+        This function writes the store to a .npz file
+        so it can be reloaded and extended on later runs.
+        """
+        fips = pd.to_numeric(self.metadata["FIPS"], errors="coerce")
+        temporary = file_name + ".tmp.npz"
+        np.savez(temporary,
+                 fips=fips.to_numpy(dtype=np.float64),
+                 states=self.metadata["Province_State"].to_numpy(dtype=str),
+                 counties=self.metadata["Admin2"].to_numpy(dtype=str),
+                 population=self.population,
+                 dates=self.dates.to_numpy(dtype="datetime64[D]"),
+                 cases=self.cases, deaths=self.deaths)
+        os.replace(temporary, file_name)
+
+    def append(self, dates, cases, deaths):
+        """
+        This function takes a DatetimeIndex of new days and
+        the (counties, new days) cases and deaths arrays, with
+        rows in the store's order, and adds them to the end of
+        the store. Only the new days of the state totals are summed.
+        """
+        cases = np.asarray(cases, dtype=np.float64)
+        deaths = np.asarray(deaths, dtype=np.float64)
+
+        self.dates = self.dates.append(pd.DatetimeIndex(dates))
+        self.cases = np.ascontiguousarray(np.hstack([self.cases, cases]))
+        self.deaths = np.ascontiguousarray(np.hstack([self.deaths, deaths]))
+        self.cached_version = None
+
+        starts = self.state_starts
+        self.state_cases = np.hstack([
+            self.state_cases,
+            np.add.reduceat(np.nan_to_num(cases), starts, axis=0)])
+        self.state_deaths = np.hstack([
+            self.state_deaths,
+            np.add.reduceat(np.nan_to_num(deaths), starts, axis=0)])
+
+    def version(self):
+        """
+        This function returns a hash string identifying the
+        dates and values currently held by the store.
+        It is computed once and again only after append.
+        """
+        if self.cached_version is not None:
+            return self.cached_version
+
+        digest = hashlib.sha256()
+        digest.update(self.dates.to_numpy(dtype="datetime64[D]").tobytes())
+        digest.update(str(self.cases.shape).encode())
+        digest.update(self.cases.tobytes())
+        digest.update(self.deaths.tobytes())
+        self.cached_version = digest.hexdigest()
+
+        return self.cached_version
+
+    def latest(self, kind):
+        """
+        This function takes "Cases" or "Deaths" and returns
+        a series of every county's newest value, indexed by FIPS.
+        Counties without a FIPS code are left out.
+        """
+        fips = pd.to_numeric(self.metadata["FIPS"], errors="coerce")
+        latest = pd.Series(self.array(kind)[:, -1], index=fips)
+        latest = latest[latest.index.notna()]
+        latest.index = latest.index.astype(int)
+
+        return latest[~latest.index.duplicated()]
+
+    def array(self, kind):
+        """
+        This function takes "Cases" or "Deaths" and
+        returns the matching (counties, days) array.
+        """
+        if kind == "Cases":
+            return self.cases
+        elif kind == "Deaths":
+            return self.deaths
+        raise KeyError(kind)
+
+    def row(self, county, state):
+        """
+        This function takes a county and state name and
+        returns the row of that county in the arrays.
+        """
+        try:
+            return self.rows[(state, county)]
+        except KeyError:
+            raise KeyError(county + ", " + state + " is not in the data")
+
+    def county(self, kind, county, state):
+        """
+        This function takes "Cases" or "Deaths", a county
+        and a state and returns the county's series as a
+        read-only view of the store's array.
+        """
+        view = self.array(kind)[self.row(county, state)]
+        view.flags.writeable = False
+
+        return view
+
+    def state(self, kind, state):
+        """
+        This function takes "Cases" or "Deaths" and a state
+        and returns the state's summed series as a read-only
+        view of the state aggregate array.
+        """
+        if kind == "Cases":
+            array = self.state_cases
+        elif kind == "Deaths":
+            array = self.state_deaths
+        else:
+            raise KeyError(kind)
+
+        try:
+            view = array[self.state_rows[state]]
+        except KeyError:
+            raise KeyError(state + " is not in the data")
+        view.flags.writeable = False
+
+        return view
+
+    def state_series(self, kind, state):
+        """
+        This function takes "Cases" or "Deaths" and a state
+        and returns the state's summed series as a pandas
+        series indexed by date, without copying.
+        """
+        return pd.Series(self.state(kind, state), index=self.dates,
+                         copy=False)
+
+    def county_series(self, kind, county, state):
+        """
+        This function takes "Cases" or "Deaths", a county
+        and a state and returns the county's series as a
+        pandas series indexed by date, without copying.
+        """
+        return pd.Series(self.county(kind, county, state),
+                         index=self.dates, copy=False)